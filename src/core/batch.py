@@ -0,0 +1,38 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from prometheus_client import Counter
+
+from .http_client import env_int
+from .ratelimit import upstream_error
+
+BATCH_CONCURRENCY = env_int("BATCH_CONCURRENCY", 8)
+BATCH_MAX_ITEMS = env_int("BATCH_MAX_ITEMS", 50)
+
+BATCH_ITEMS = Counter("batch_items_total", "Items resolved by batch requests", ["status"])
+
+
+async def gather_bounded(calls: Dict[Hashable, Callable[[], Awaitable[Any]]],
+                         concurrency: int = BATCH_CONCURRENCY) -> Dict[Hashable, Any]:
+    """Run the calls with at most ``concurrency`` at a time, an exception is returned as that key's result."""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def bounded(call):
+        async with semaphore:
+            return await call()
+
+    results = await asyncio.gather(*(bounded(call) for call in calls.values()), return_exceptions=True)
+    return dict(zip(calls, results))
+
+
+def batch_result(result: Any) -> Tuple[int, Dict[str, Any]]:
+    """Status code and body of one batch item, errors look like the single item route's error."""
+    if isinstance(result, Exception):
+        error = upstream_error(result)
+        status, body = error.status_code, {"error": error.detail or type(result).__name__}
+    elif isinstance(result, BaseException):
+        status, body = 500, {"error": type(result).__name__}
+    else:
+        status, body = 200, {"data": result}
+    BATCH_ITEMS.labels(status).inc()
+    return status, body
@@ -0,0 +1,158 @@
+import time
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+import httpx
+from prometheus_client import Counter, Gauge
+
+from .http_client import env_bool, env_float, env_int, upstream_key
+from .ratelimit import UpstreamOverloaded
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+UPSTREAM_CIRCUIT_STATE = Gauge(
+    "upstream_circuit_state", "Circuit breaker state per upstream (0 closed, 1 half open, 2 open)", ["upstream"])
+UPSTREAM_CIRCUIT_TRANSITIONS = Counter(
+    "upstream_circuit_transitions_total", "Circuit breaker state changes per upstream", ["upstream", "state"])
+UPSTREAM_CIRCUIT_REJECTED = Counter(
+    "upstream_circuit_rejected_total", "Requests failed fast because the upstream circuit was open", ["upstream"])
+
+
+class CircuitOpen(UpstreamOverloaded):
+    """The upstream failed too often recently, requests to it fail fast until it is probed again."""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(upstream, "circuit open", retry_after)
+
+
+class CircuitBreaker:
+    """Closed / open / half open breaker for one upstream host.
+
+    Closed: the outcome of the last ``window`` requests is kept, a request
+    fails when it raises a transport error, gets a 5xx or takes longer than
+    ``slow_threshold``. Once at least ``min_calls`` were seen and the failure
+    rate reaches ``failure_rate`` the circuit opens. Open: requests fail
+    immediately for ``open_seconds``. Half open: up to ``probes`` requests go
+    through; a success closes the circuit, a failure opens it again.
+    """
+
+    def __init__(self, name: str, window: int = 20, min_calls: int = 10, failure_rate: float = 0.5,
+                 slow_threshold: float = 5.0, open_seconds: float = 30.0, probes: int = 1):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_threshold = slow_threshold
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._probing = 0
+        UPSTREAM_CIRCUIT_STATE.labels(name).set(STATE_VALUES[CLOSED])
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        logging.warning(f"Circuit for {self.name} is now {state.replace('_', ' ')}")
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        if state == CLOSED:
+            self._outcomes.clear()
+        UPSTREAM_CIRCUIT_STATE.labels(self.name).set(STATE_VALUES[state])
+        UPSTREAM_CIRCUIT_TRANSITIONS.labels(self.name, state).inc()
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    @property
+    def is_open(self) -> bool:
+        """Open and not yet due for a probe, callers with alternatives should use those."""
+        return self.state == OPEN and self.retry_after() > 0
+
+    def _admit(self) -> bool:
+        """Raise CircuitOpen or let the request through, returns whether it is a half open probe."""
+        if self.state == OPEN:
+            if self.retry_after() > 0:
+                UPSTREAM_CIRCUIT_REJECTED.labels(self.name).inc()
+                raise CircuitOpen(self.name, self.retry_after())
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probing >= self.probes:
+                UPSTREAM_CIRCUIT_REJECTED.labels(self.name).inc()
+                raise CircuitOpen(self.name, 1.0)
+            self._probing += 1
+            return True
+        return False
+
+    def _record(self, probe: bool, outcome: Optional[Tuple[bool, float]]):
+        if probe:
+            self._probing -= 1
+        if outcome is None:
+            # Never reached the upstream (queued out, cancelled), says nothing about its health
+            return
+        ok = outcome[0] and outcome[1] <= self.slow_threshold
+        if self.state == HALF_OPEN:
+            self._transition(CLOSED if ok else OPEN)
+            return
+        if self.state == OPEN:
+            return
+        self._outcomes.append(ok)
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+            self._transition(OPEN)
+
+    async def call(self, send: Callable[[], Awaitable[httpx.Response]],
+                   queue: Optional[Callable[[Callable[[], Awaitable[httpx.Response]]], Awaitable[httpx.Response]]] = None
+                   ) -> httpx.Response:
+        """Send through the breaker; ``queue`` (a rate limiter) runs after the open check so
+        an open circuit fails fast, and its wait does not count as upstream latency."""
+        probe = self._admit()
+        outcome: Optional[Tuple[bool, float]] = None
+
+        async def observed() -> httpx.Response:
+            nonlocal outcome
+            started = time.monotonic()
+            try:
+                response = await send()
+            except httpx.RequestError:
+                outcome = (False, time.monotonic() - started)
+                raise
+            outcome = (response.status_code < 500, time.monotonic() - started)
+            return response
+
+        try:
+            return await (queue(observed) if queue is not None else observed())
+        finally:
+            self._record(probe, outcome)
+
+
+class CircuitBreakers:
+    """One CircuitBreaker per upstream host, created on first use with the BREAKER_* settings."""
+
+    def __init__(self, enabled: Optional[bool] = None):
+        self.enabled = enabled if enabled is not None else env_bool("BREAKER_ENABLED", True)
+        self.settings = dict(
+            window=env_int("BREAKER_WINDOW", 20),
+            min_calls=env_int("BREAKER_MIN_CALLS", 10),
+            failure_rate=env_float("BREAKER_FAILURE_RATE", 0.5),
+            slow_threshold=env_int("BREAKER_SLOW_MS", 5000) / 1000,
+            open_seconds=env_float("BREAKER_OPEN_SECONDS", 30.0),
+            probes=env_int("BREAKER_HALF_OPEN_PROBES", 1),
+        )
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, url: str) -> Optional[CircuitBreaker]:
+        if not self.enabled:
+            return None
+        key = upstream_key(url)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = CircuitBreaker(key, **self.settings)
+        return breaker
+
+    def is_open(self, url: str) -> bool:
+        breaker = self._breakers.get(upstream_key(url)) if self.enabled else None
+        return breaker is not None and breaker.is_open
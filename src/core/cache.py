@@ -0,0 +1,164 @@
+import sys
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+from prometheus_client import Counter, Gauge
+
+from .http_client import env_int
+from .singleflight import SingleFlight
+
+# Seconds a page is served fresh, per route family. HTML_CACHE_TTL_<ROUTE> overrides.
+DEFAULT_TTLS = {
+    "list": 300,
+    "details": 600,
+    "chapter": 3600,
+    "search": 120,
+}
+
+HTML_CACHE_REQUESTS = Counter(
+    "html_cache_requests_total", "Scraper HTML cache lookups", ["route", "result"])
+HTML_CACHE_BYTES = Gauge("html_cache_bytes", "Bytes held by the scraper HTML cache")
+HTML_CACHE_EVICTIONS = Counter("html_cache_evictions_total", "Entries evicted from the scraper HTML cache")
+
+
+class CacheEntry:
+    __slots__ = ("value", "size", "expires_at", "stale_until")
+
+    def __init__(self, value: str, size: int, expires_at: float, stale_until: float):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+
+
+class HtmlCache:
+    """URL keyed page cache with per route TTLs, a byte bounded LRU and stale-while-revalidate.
+
+    Expired entries are still served for ``stale_ttl`` seconds while a single
+    background task refreshes them from upstream.
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None, stale_ttl: Optional[int] = None,
+                 ttls: Optional[Dict[str, int]] = None):
+        self.max_bytes = max_bytes if max_bytes is not None else env_int("HTML_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+        self.stale_ttl = stale_ttl if stale_ttl is not None else env_int("HTML_CACHE_STALE_TTL", 3600)
+        # How much longer than stale_ttl a page may be served when upstream fails (or its circuit is open)
+        self.stale_if_error = env_int("HTML_CACHE_STALE_IF_ERROR", 86400)
+        self.ttls = {route: env_int(f"HTML_CACHE_TTL_{route.upper()}", ttl) for route, ttl in DEFAULT_TTLS.items()}
+        self.ttls.update(ttls or {})
+
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._refreshing: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def ttl_for(self, route: Optional[str]) -> int:
+        return self.ttls.get(route, 0) if route else 0
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[str]], route: Optional[str]) -> str:
+        ttl = self.ttl_for(route)
+        if ttl <= 0 or self.max_bytes <= 0:
+            return await fetch()
+
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if now < entry.expires_at:
+                self._entries.move_to_end(key)
+                HTML_CACHE_REQUESTS.labels(route, "hit").inc()
+                return entry.value
+            if now < entry.stale_until:
+                self._entries.move_to_end(key)
+                HTML_CACHE_REQUESTS.labels(route, "stale").inc()
+                self._revalidate(key, fetch, ttl)
+                return entry.value
+
+        HTML_CACHE_REQUESTS.labels(route, "miss").inc()
+        try:
+            value = await fetch()
+        except Exception as e:
+            if entry is not None and now < entry.stale_until + self.stale_if_error:
+                HTML_CACHE_REQUESTS.labels(route, "stale_if_error").inc()
+                logging.warning(f"Serving stale {key}, upstream failed: {e}")
+                return entry.value
+            raise
+        self.put(key, value, ttl)
+        return value
+
+    def put(self, key: str, value: str, ttl: int):
+        size = sys.getsizeof(value)
+        if size > self.max_bytes:
+            return
+        self.discard(key)
+        now = time.monotonic()
+        self._entries[key] = CacheEntry(value, size, now + ttl, now + ttl + self.stale_ttl)
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            HTML_CACHE_EVICTIONS.inc()
+        HTML_CACHE_BYTES.set(self._bytes)
+
+    def discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+            HTML_CACHE_BYTES.set(self._bytes)
+
+    def _revalidate(self, key: str, fetch: Callable[[], Awaitable[str]], ttl: int):
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+
+        async def refresh():
+            try:
+                self.put(key, await fetch(), ttl)
+            except Exception as e:
+                logging.warning(f"Background refresh of {key} failed: {e}")
+            finally:
+                self._refreshing.discard(key)
+
+        task = asyncio.create_task(refresh())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def aclose(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+class TtlMemo:
+    """Short lived memo for parsed scraper results, bounded by entry count."""
+
+    def __init__(self, kind: str, ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        self.ttl = ttl if ttl is not None else env_int(f"{kind.upper()}_MEMO_TTL", 60)
+        self.max_entries = max_entries if max_entries is not None else env_int(f"{kind.upper()}_MEMO_SIZE", 1024)
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight = SingleFlight(kind)
+
+    async def get_or_call(self, key: Hashable, fn: Callable[[], Awaitable[Any]],
+                          ttl_for: Optional[Callable[[Any], Optional[float]]] = None) -> Any:
+        """``ttl_for`` can shorten the TTL per value (None keeps the default, 0 or less skips caching it)."""
+        if self.ttl <= 0:
+            return await fn()
+        cached = self._entries.get(key)
+        if cached is not None and time.monotonic() < cached[0]:
+            self._entries.move_to_end(key)
+            return cached[1]
+        value = await self._inflight.do(key, fn)
+        ttl = self.ttl
+        if ttl_for is not None:
+            value_ttl = ttl_for(value)
+            ttl = ttl if value_ttl is None else min(ttl, value_ttl)
+        if ttl <= 0:
+            return value
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
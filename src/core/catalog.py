@@ -0,0 +1,333 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+from urllib.parse import urlencode
+
+from prometheus_client import Counter, Gauge
+
+from .http_client import env_bool, env_int
+
+CATALOG_READS = Counter("catalog_reads_total", "List and detail reads answered by the catalog", ["kind", "result"])
+CATALOG_TITLES = Gauge("catalog_titles", "Titles in the local catalog", ["server"])
+CATALOG_CRAWLED_PAGES = Counter("catalog_crawled_pages_total", "Pages fetched by the catalog crawler", ["server", "kind"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS titles (
+    server TEXT NOT NULL,
+    id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    title TEXT,
+    card TEXT,
+    details TEXT,
+    listed_at REAL,
+    details_at REAL,
+    PRIMARY KEY (server, id)
+);
+CREATE TABLE IF NOT EXISTS chapters (
+    server TEXT NOT NULL,
+    title_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    chapter_id TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (server, title_id, position)
+);
+CREATE TABLE IF NOT EXISTS listings (
+    server TEXT NOT NULL,
+    listing TEXT NOT NULL,
+    items TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (server, listing)
+);
+"""
+
+
+def listing_key(name: str, **params) -> str:
+    """Stable key of one listing page, e.g. ``list?genre=All&page=1``; unset params are left out."""
+    present = sorted((key, str(value)) for key, value in params.items() if value not in (None, ""))
+    return f"{name}?{urlencode(present)}" if present else name
+
+
+class CatalogStore:
+    """SQLite store of scraped titles, their chapter lists and listing pages.
+
+    Cards (the list entry of a title) and details are kept as json next to the
+    columns needed to query them; chapters get their own rows. All methods are
+    blocking, the Catalog runs them in a thread.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("CATALOG_DB", os.path.join(".cache", "catalog.sqlite"))
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def put_listing(self, server: str, kind: str, listing: str, items: List[Dict[str, Any]]) -> int:
+        """Store a listing page and upsert its titles' cards, returns how many cards were new or changed."""
+        now = time.time()
+        changed = 0
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO listings (server, listing, items, fetched_at) VALUES (?, ?, ?, ?)",
+                (server, listing, json.dumps(items), now))
+            for item in items:
+                title_id = item.get("id")
+                if not title_id:
+                    continue
+                card = json.dumps(item, sort_keys=True)
+                row = self._db.execute(
+                    "SELECT card FROM titles WHERE server = ? AND id = ?", (server, title_id)).fetchone()
+                if row is None:
+                    self._db.execute(
+                        "INSERT INTO titles (server, id, kind, title, card, listed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                        (server, title_id, kind, item.get("title"), card, now))
+                    changed += 1
+                elif row[0] != card:
+                    # A new chapter or episode shows up on the card first, the details are out of date
+                    self._db.execute(
+                        "UPDATE titles SET title = ?, card = ?, listed_at = ?, details_at = NULL WHERE server = ? AND id = ?",
+                        (item.get("title"), card, now, server, title_id))
+                    changed += 1
+                else:
+                    self._db.execute(
+                        "UPDATE titles SET listed_at = ? WHERE server = ? AND id = ?", (now, server, title_id))
+        return changed
+
+    def get_listing(self, server: str, listing: str) -> Optional[Tuple[List[Dict[str, Any]], float]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT items, fetched_at FROM listings WHERE server = ? AND listing = ?", (server, listing)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def put_details(self, server: str, kind: str, title_id: str, details: Dict[str, Any]):
+        chapters = details.get("chapters") or []
+        rest = {key: value for key, value in details.items() if key != "chapters"}
+        if "chapters" in details:
+            # Chapters get rows of their own, the empty list only records that the key was there
+            rest["chapters"] = []
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                """INSERT INTO titles (server, id, kind, title, details, details_at) VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (server, id) DO UPDATE SET title = COALESCE(excluded.title, title),
+                   details = excluded.details, details_at = excluded.details_at""",
+                (server, title_id, kind, rest.get("title"), json.dumps(rest, default=str), now))
+            self._db.execute("DELETE FROM chapters WHERE server = ? AND title_id = ?", (server, title_id))
+            self._db.executemany(
+                "INSERT INTO chapters (server, title_id, position, chapter_id, data) VALUES (?, ?, ?, ?, ?)",
+                [(server, title_id, position, chapter.get("chapterId"), json.dumps(chapter))
+                 for position, chapter in enumerate(chapters)])
+
+    def get_details(self, server: str, title_id: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT details, details_at FROM titles WHERE server = ? AND id = ? AND details IS NOT NULL",
+                (server, title_id)).fetchone()
+            if row is None:
+                return None
+            chapters = self._db.execute(
+                "SELECT data FROM chapters WHERE server = ? AND title_id = ? ORDER BY position",
+                (server, title_id)).fetchall()
+        details = json.loads(row[0])
+        if chapters or "chapters" in details:
+            details["chapters"] = [json.loads(chapter) for chapter, in chapters]
+        # details_at is cleared when the card changed, that makes the details stale
+        return details, row[1] or 0.0
+
+    def titles_needing_details(self, server: str, older_than: float, limit: int) -> List[str]:
+        with self._lock:
+            rows = self._db.execute(
+                """SELECT id FROM titles WHERE server = ? AND (details_at IS NULL OR details_at < ?)
+                   ORDER BY details_at IS NOT NULL, listed_at DESC LIMIT ?""",
+                (server, older_than, limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def count_titles(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT server, COUNT(*) FROM titles GROUP BY server").fetchall()
+        return dict(rows)
+
+
+class Catalog:
+    """Serves list and detail reads from the CatalogStore, refreshing from upstream.
+
+    Fresher than ``max_age``: answered locally. Older: answered locally while
+    one background task refreshes it. Missing: fetched live and written
+    through. Without a store (CATALOG_ENABLED unset) every read goes upstream.
+    """
+
+    def __init__(self, store: Optional[CatalogStore] = None, max_age: Optional[int] = None):
+        self.store = store
+        self.max_age = max_age if max_age is not None else env_int("CATALOG_MAX_AGE", 600)
+        self._refreshing: Set[Tuple[str, str, str]] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    @classmethod
+    def from_env(cls) -> "Catalog":
+        return cls(CatalogStore() if env_bool("CATALOG_ENABLED", False) else None)
+
+    @property
+    def enabled(self) -> bool:
+        return self.store is not None
+
+    async def listing(self, server: str, kind: str, listing: str,
+                      fetch: Callable[[], Awaitable[List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+        if not self.enabled:
+            return await fetch()
+
+        async def refresh():
+            items = await fetch()
+            await asyncio.to_thread(self.store.put_listing, server, kind, listing, items)
+            return items
+
+        stored = await asyncio.to_thread(self.store.get_listing, server, listing)
+        return await self._read("listing", (server, "listing", listing), stored, refresh)
+
+    async def details(self, server: str, kind: str, title_id: str,
+                      fetch: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        if not self.enabled:
+            return await fetch()
+
+        async def refresh():
+            details = await fetch()
+            await asyncio.to_thread(self.store.put_details, server, kind, title_id, details)
+            return details
+
+        stored = await asyncio.to_thread(self.store.get_details, server, title_id)
+        return await self._read("details", (server, "details", title_id), stored, refresh)
+
+    async def _read(self, kind: str, key: Tuple[str, str, str], stored: Optional[Tuple[Any, float]],
+                    refresh: Callable[[], Awaitable[Any]]) -> Any:
+        if stored is None:
+            CATALOG_READS.labels(kind, "miss").inc()
+            return await refresh()
+        value, fetched_at = stored
+        if time.time() - fetched_at < self.max_age:
+            CATALOG_READS.labels(kind, "hit").inc()
+        else:
+            CATALOG_READS.labels(kind, "stale").inc()
+            self._refresh_later(key, refresh)
+        return value
+
+    def _refresh_later(self, key: Tuple[str, str, str], refresh: Callable[[], Awaitable[Any]]):
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+
+        async def run():
+            try:
+                await refresh()
+            except Exception as e:
+                logging.warning(f"Catalog refresh of {key} failed: {e}")
+            finally:
+                self._refreshing.discard(key)
+
+        task = asyncio.create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def aclose(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.store is not None:
+            self.store.close()
+
+
+class CatalogCrawler:
+    """Walks listing pages of the configured servers in the background and fills the catalog.
+
+    Each cycle walks every listing from page 1 and stops early once a page
+    had nothing new, then fetches details for titles that have none or whose
+    card changed. One request at a time with a pause in between, on top of
+    the upstream rate limits.
+    """
+
+    def __init__(self, catalog: Catalog, targets: Sequence["CrawlTarget"], enabled: Optional[bool] = None,
+                 interval: Optional[int] = None,
+                 delay: Optional[float] = None, pages: Optional[int] = None, details_per_cycle: Optional[int] = None,
+                 details_max_age: Optional[int] = None):
+        self.catalog = catalog
+        self.targets = list(targets)
+        self.enabled = enabled if enabled is not None else env_bool("CATALOG_CRAWL", False)
+        self.interval = interval if interval is not None else env_int("CATALOG_CRAWL_INTERVAL", 1800)
+        self.delay = delay if delay is not None else env_int("CATALOG_CRAWL_DELAY_MS", 1000) / 1000
+        self.pages = pages if pages is not None else env_int("CATALOG_CRAWL_PAGES", 5)
+        self.details_per_cycle = details_per_cycle if details_per_cycle is not None else env_int(
+            "CATALOG_CRAWL_DETAILS", 50)
+        self.details_max_age = details_max_age if details_max_age is not None else env_int(
+            "CATALOG_DETAILS_MAX_AGE", 86400)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.enabled and self.catalog.enabled and self.targets and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            for target in self.targets:
+                try:
+                    await self.crawl(target)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logging.warning(f"Catalog crawl of {target.server} stopped: {e}")
+            for server, count in (await asyncio.to_thread(self.catalog.store.count_titles)).items():
+                CATALOG_TITLES.labels(server).set(count)
+            await asyncio.sleep(self.interval)
+
+    async def crawl(self, target: "CrawlTarget"):
+        store = self.catalog.store
+        for name, params, fetch in target.listings():
+            for page in range(1, self.pages + 1):
+                items = await fetch(page)
+                CATALOG_CRAWLED_PAGES.labels(target.server, "listing").inc()
+                key = listing_key(name, **params, page=page)
+                changed = await asyncio.to_thread(store.put_listing, target.server, target.kind, key, items)
+                await asyncio.sleep(self.delay)
+                if not items or (page > 1 and not changed):
+                    break
+
+        ids = await asyncio.to_thread(
+            store.titles_needing_details, target.server, time.time() - self.details_max_age, self.details_per_cycle)
+        for title_id in ids:
+            try:
+                details = await target.details(title_id)
+            except Exception as e:
+                logging.info(f"Catalog crawl skipped {target.server} {title_id}: {e}")
+            else:
+                await asyncio.to_thread(store.put_details, target.server, target.kind, title_id, details)
+            CATALOG_CRAWLED_PAGES.labels(target.server, "details").inc()
+            await asyncio.sleep(self.delay)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class CrawlTarget:
+    """What to crawl on one server: its listings (name, params, fetch(page)) and how to get details."""
+
+    def __init__(self, server: str, kind: str,
+                 listings: Callable[[], List[Tuple[str, Dict[str, Any], Callable[[int], Awaitable[List[Dict]]]]]],
+                 details: Callable[[str], Awaitable[Dict[str, Any]]]):
+        self.server = server
+        self.kind = kind
+        self.listings = listings
+        self.details = details
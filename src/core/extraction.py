@@ -0,0 +1,194 @@
+import os
+import re
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse, urlunparse
+
+import soupsieve
+
+from .parsing import PageParts, make_soup
+
+
+class ExtractionError(Exception):
+    pass
+
+
+def parse_date(date_str):
+    # Define multiple formats to try
+    date_formats = [
+        "%b %d,%Y - %H:%M %p",  # Adjusted for 24-hour format and AM/PM
+        "%b %d, %Y - %H:%M %p",  # Adjusted for space after the comma and 24-hour format
+        "%b %d,%Y - %I:%M %p",  # Your original format
+        # Add more formats as necessary
+    ]
+
+    # Remove any potential extra spaces (for more robust parsing)
+    date_str = re.sub(r'\s+', ' ', date_str)
+
+    for fmt in date_formats:
+        try:
+            return datetime.strptime(date_str, fmt)
+        except ValueError:
+            continue  # Try the next format if current one fails
+    return None  # Return None if all formats fail
+
+
+def url_path(value: str) -> str:
+    # Strip scheme and domain, the frontend loads images through our proxy
+    parsed = urlparse(value)
+    return urlunparse(('', '', parsed.path, parsed.params, parsed.query, parsed.fragment))
+
+
+def abbreviated_number(value: str) -> float:
+    return float(re.sub(r'[KM]', lambda x: "e3" if x.group(0) == 'K' else "e6", value))
+
+
+def formatted_date(value: str) -> Optional[str]:
+    date = parse_date(value)
+    return date.strftime("%Y-%m-%d %H:%M") if date else None
+
+
+def segment(index: str) -> Callable[[str], str]:
+    return lambda value: value.split('/')[int(index)]
+
+
+def drop_label(label: str) -> Callable[[str], str]:
+    pattern = re.compile(rf'^{re.escape(label)}\s*:\s*', re.IGNORECASE)
+    return lambda value: pattern.sub('', value)
+
+
+# name -> function, or name -> factory taking the text after "name:"
+TRANSFORMS: Dict[str, Callable[[str], Any]] = {
+    "strip": str.strip,
+    "float": float,
+    "int": int,
+    "path": url_path,
+    "basename": lambda value: os.path.basename(urlparse(value).path),
+    "abbreviated_number": abbreviated_number,
+    "date": formatted_date,
+}
+TRANSFORM_FACTORIES: Dict[str, Callable[[str], Callable[[str], Any]]] = {
+    "segment": segment,
+    "drop_label": drop_label,
+}
+
+
+def compile_transform(name: str) -> Callable[[Any], Any]:
+    base, _, argument = name.partition(":")
+    if argument and base in TRANSFORM_FACTORIES:
+        return TRANSFORM_FACTORIES[base](argument)
+    if name in TRANSFORMS:
+        return TRANSFORMS[name]
+    raise ExtractionError(f"Unknown transform {name}")
+
+
+def compile_selector(selector: Optional[str]):
+    return soupsieve.compile(selector) if selector else None
+
+
+class FieldPlan:
+    """One output field: where the value comes from and how it is cleaned up.
+
+    The value is taken from ``select`` (relative to the item, or the item
+    itself), another field (``from``), the raw page (``regex``) or the item
+    position (``value: index|count``). Missing values use ``default``, or
+    fail the page when ``required``. Transforms run on present values, one
+    that fails or returns None also falls back to ``default``.
+    """
+
+    def __init__(self, name: str, spec: Dict[str, Any]):
+        self.name = name
+        self.hidden = name.startswith("_")
+        self.selector = compile_selector(spec.get("select"))
+        self.many = spec.get("all", False)
+        self.attr = spec.get("attr")
+        self.attr_default = spec.get("attr_default")
+        self.strip = spec.get("strip", self.attr is None)
+        self.source = spec.get("from")
+        self.regex = re.compile(spec["regex"]) if "regex" in spec else None
+        self.value = spec.get("value")
+        self.default = spec.get("default")
+        self.required = spec.get("required", False)
+        self.nonempty = spec.get("nonempty", False)
+        self.slice = slice(*spec["slice"]) if "slice" in spec else None
+        self.transforms = [compile_transform(name) for name in spec.get("transforms", [])]
+        self.fallback = FieldPlan(name, spec["fallback"]) if "fallback" in spec else None
+        self.items = PagePlan(spec) if "items" in spec else None
+
+    def read(self, element) -> Any:
+        if self.attr is None:
+            text = element.get_text()
+            return text.strip() if self.strip else text
+        value = element.get(self.attr, self.attr_default)
+        if isinstance(value, list):
+            value = " ".join(value)
+        return value.strip() if self.strip and isinstance(value, str) else value
+
+    def apply(self, value: Any) -> Any:
+        for transform in self.transforms:
+            try:
+                value = transform(value)
+            except (ValueError, IndexError, TypeError):
+                return self.default
+            if value is None:
+                return self.default
+        return value
+
+    def extract(self, scope, html: str, values: Dict[str, Any], position: int, count: int) -> Any:
+        if self.items is not None:
+            return self.items.extract_items(scope, html)
+        if self.value == "index":
+            return position
+        if self.value == "count":
+            return count
+        if self.source is not None:
+            value = values.get(self.source)
+            return self.apply(value) if value else self.default
+        if self.regex is not None:
+            match = self.regex.search(html)
+            if match:
+                return self.apply(match.group(1))
+            return self.fallback.extract(scope, html, values, position, count) if self.fallback else self.default
+
+        if self.many:
+            elements = self.selector.select(scope) if self.selector else [scope]
+            result = [self.apply(self.read(element)) for element in elements]
+            return result[self.slice] if self.slice else result
+
+        element = self.selector.select_one(scope) if self.selector else scope
+        if element is None:
+            if self.required:
+                raise ExtractionError(f"Required field {self.name} not found")
+            return self.default
+        value = self.read(element)
+        if value is None or (self.nonempty and value == ""):
+            return self.default
+        return self.apply(value)
+
+
+class PagePlan:
+    """Compiled spec for one page (or a repeated block of one): its parts, item selector and fields."""
+
+    def __init__(self, spec: Dict[str, Any]):
+        parts = spec.get("parts")
+        self.parts = PageParts(parts.get("classes", ()), parts.get("ids", ()), parts.get("attrs")) if parts else None
+        self.items = compile_selector(spec.get("items"))
+        self.fields = [FieldPlan(name, field) for name, field in spec.get("fields", {}).items()]
+
+    def extract_fields(self, scope, html: str, position: int = 0, count: int = 0) -> Dict[str, Any]:
+        values: Dict[str, Any] = {}
+        for field in self.fields:
+            values[field.name] = field.extract(scope, html, values, position, count)
+        # Fields named _something only feed other fields
+        return {field.name: values[field.name] for field in self.fields if not field.hidden}
+
+    def extract_items(self, scope, html: str) -> List[Dict[str, Any]]:
+        elements = self.items.select(scope)
+        return [self.extract_fields(element, html, position, len(elements))
+                for position, element in enumerate(elements, start=1)]
+
+    def extract(self, html: str) -> Any:
+        soup = make_soup(html, self.parts)
+        if self.items is not None:
+            return self.extract_items(soup, html)
+        return self.extract_fields(soup, html)
@@ -0,0 +1,97 @@
+import re
+import asyncio
+import unicodedata
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from prometheus_client import Counter
+
+from .http_client import env_float
+
+FEDERATED_DEADLINE = env_float("FEDERATED_SEARCH_DEADLINE", 8.0)
+FEDERATED_SERVER_TIMEOUT = env_float("FEDERATED_SEARCH_SERVER_TIMEOUT", 5.0)
+
+FEDERATED_SERVER_RESULTS = Counter(
+    "federated_search_servers_total", "Per server outcome of federated searches", ["server", "status"])
+
+
+def normalize_title(title: Optional[str]) -> str:
+    # "Solo Leveling", "solo-leveling" and "Solo Levelíng " are the same manga
+    decomposed = unicodedata.normalize("NFKD", title or "")
+    ascii_title = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return re.sub(r"[^a-z0-9]+", " ", ascii_title.lower()).strip()
+
+
+async def fan_out(calls: Dict[str, Callable[[], Awaitable[Any]]], deadline: Optional[float] = None,
+                  timeout: Optional[float] = None) -> AsyncIterator[Tuple[str, str, Any, float]]:
+    """Run all calls concurrently and yield ``(name, status, result, seconds)`` as each one finishes.
+
+    status is ``ok`` (result is the return value), ``error`` (result is the
+    message) or ``timeout``. Each call gets ``timeout`` seconds and the whole
+    fan out ``deadline`` seconds, whatever is still running then is cancelled
+    and reported as a timeout.
+    """
+    deadline = deadline if deadline is not None else FEDERATED_DEADLINE
+    timeout = timeout if timeout is not None else FEDERATED_SERVER_TIMEOUT
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    tasks = {asyncio.ensure_future(asyncio.wait_for(fn(), timeout)): name for name, fn in calls.items()}
+    order = list(calls)
+    pending = set(tasks)
+    try:
+        while pending:
+            remaining = started + deadline - loop.time()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            elapsed = loop.time() - started
+            for task in sorted(done, key=lambda task: order.index(tasks[task])):
+                name = tasks[task]
+                error = task.exception()
+                if error is None:
+                    status, result = "ok", task.result()
+                elif isinstance(error, asyncio.TimeoutError):
+                    status, result = "timeout", None
+                else:
+                    status, result = "error", str(error) or type(error).__name__
+                FEDERATED_SERVER_RESULTS.labels(name, status).inc()
+                yield name, status, result, elapsed
+        for task in sorted(pending, key=lambda task: order.index(tasks[task])):
+            FEDERATED_SERVER_RESULTS.labels(tasks[task], "timeout").inc()
+            yield tasks[task], "timeout", None, loop.time() - started
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+class SearchMerger:
+    """Merges search results of several servers, keeping the first result per normalized title."""
+
+    def __init__(self):
+        self._by_title: Dict[str, Dict[str, Any]] = {}
+        self.mangas: List[Dict[str, Any]] = []
+
+    def add(self, server: str, mangas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Add one server's results, returning the ones not seen on an earlier server."""
+        added = []
+        for manga in mangas:
+            key = normalize_title(manga.get("title"))
+            existing = self._by_title.get(key) if key else None
+            if existing is not None:
+                if server not in existing["servers"]:
+                    existing["servers"].append(server)
+                continue
+            merged = {**manga, "server": server, "servers": [server]}
+            if key:
+                self._by_title[key] = merged
+            self.mangas.append(merged)
+            added.append(merged)
+        return added
+
+
+def server_status(status: str, result: Any, seconds: float) -> Dict[str, Any]:
+    summary: Dict[str, Any] = {"status": status, "seconds": round(seconds, 3)}
+    if status == "ok":
+        summary["count"] = len(result.get("mangas", [])) if isinstance(result, dict) else len(result)
+    elif status == "error":
+        summary["error"] = result
+    return summary
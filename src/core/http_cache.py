@@ -0,0 +1,161 @@
+import re
+import hashlib
+from email.utils import parsedate_to_datetime
+from typing import List, Optional, Tuple
+
+from .http_client import env_int
+
+# First match wins. Anything unmatched (/, /metrics, docs) gets no Cache-Control.
+ROUTE_FAMILIES: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r"\.(jpe?g|png|gif|webp|avif|bmp)$", re.IGNORECASE), "images"),
+    # Recommendations change whenever new titles are embedded, unlike chapters
+    (re.compile(r"^/api/manga/[^/]+/similar$"), "similar"),
+    (re.compile(r"^/api/manga/[^/]+/[^/]+$"), "chapters"),
+    (re.compile(r"^/api/(manga|anime|details)/[^/]+$"), "details"),
+    # Episode links carry short-lived signed urls, never let a browser keep them
+    (re.compile(r"^/(api/anime/[^/]+/[^/]+|api/watching/|episode/)"), "episodes"),
+    (re.compile(r"^/(api/|search/|anime/|recent/|genre/|top-airing/|movies/|popular/|genres/|anime-list/)"), "lists"),
+]
+
+DEFAULT_MAX_AGES = {
+    "lists": 300,
+    "details": 600,
+    "chapters": 3600,
+    "similar": 300,
+    "images": 604800,
+    "episodes": 0,
+}
+MAX_AGES = {family: env_int(f"CACHE_MAX_AGE_{family.upper()}", age) for family, age in DEFAULT_MAX_AGES.items()}
+
+
+# Set by the image routes when a ?w= / ?format= variant could not be made (core.image_proxy.VARIANT_HEADER)
+FALLBACK_HEADER = b"x-image-variant"
+
+# Describe the body, so they are dropped from 304 responses
+BODY_HEADERS = (b"content-length", b"content-type", b"content-encoding", b"accept-ranges", b"transfer-encoding")
+
+
+def route_family(path: str) -> Optional[str]:
+    for pattern, family in ROUTE_FAMILIES:
+        if pattern.search(path):
+            return family
+    return None
+
+
+def cache_control(family: Optional[str]) -> Optional[bytes]:
+    if family is None:
+        return None
+    max_age = MAX_AGES.get(family, 0)
+    if max_age <= 0:
+        return b"no-store"
+    return f"public, max-age={max_age}".encode()
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 asks for If-None-Match
+    wanted = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == wanted for tag in if_none_match.split(","))
+
+
+def not_modified_since(if_modified_since: str, last_modified: str) -> bool:
+    try:
+        return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+
+class _BodySuppressed(Exception):
+    """Raised into the app once a 304 went out, to stop it streaming a body nobody reads."""
+
+
+class ConditionalCacheMiddleware:
+    """ETag / Last-Modified validation and per route family Cache-Control for GET responses.
+
+    JSON bodies are buffered to compute a strong ETag from their bytes; other
+    responses (images) are validated against the ETag / Last-Modified they
+    already carry, without touching the body.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = {name.decode().lower(): value.decode() for name, value in scope["headers"]}
+        family = route_family(scope["path"])
+        state = {"mode": None, "start": None, "body": []}
+
+        async def send_not_modified(headers):
+            keep = [(name, value) for name, value in headers if name.lower() not in BODY_HEADERS]
+            await send({"type": "http.response.start", "status": 304, "headers": keep})
+            await send({"type": "http.response.body", "body": b""})
+
+        def is_fresh(headers) -> bool:
+            etag = headers.get("etag")
+            if "if-none-match" in request_headers:
+                return etag is not None and etag_matches(request_headers["if-none-match"], etag)
+            last_modified = headers.get("last-modified")
+            if "if-modified-since" in request_headers and last_modified:
+                return not_modified_since(request_headers["if-modified-since"], last_modified)
+            return False
+
+        async def wrapped_send(message):
+            if message["type"] == "http.response.start":
+                if message["status"] != 200:
+                    state["mode"] = "passthrough"
+                    await send(message)
+                    return
+                headers = list(message.get("headers", []))
+                control = cache_control(family)
+                if any(name.lower() == FALLBACK_HEADER for name, _ in headers):
+                    # The original served in place of a variant, don't keep it under the variant's url
+                    control = b"no-store"
+                if control is not None:
+                    headers = [(name, value) for name, value in headers if name.lower() != b"cache-control"]
+                    headers.append((b"cache-control", control))
+                message["headers"] = headers
+                decoded = {name.decode().lower(): value.decode() for name, value in headers}
+
+                if "etag" not in decoded and decoded.get("content-type", "").startswith("application/json"):
+                    state["mode"] = "buffer"
+                    state["start"] = message
+                    return
+                if family not in (None, "episodes") and is_fresh(decoded):
+                    state["mode"] = "suppress"
+                    await send_not_modified(headers)
+                    return
+                state["mode"] = "passthrough"
+                await send(message)
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            if state["mode"] == "suppress":
+                raise _BodySuppressed()
+            if state["mode"] != "buffer":
+                await send(message)
+                return
+
+            state["body"].append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = b"".join(state["body"])
+            start = state["start"]
+            etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+            headers = [*start["headers"], (b"etag", etag.encode())]
+            if family not in (None, "episodes") and is_fresh({"etag": etag}):
+                await send_not_modified(headers)
+                return
+            await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+
+        try:
+            await self.app(scope, receive, wrapped_send)
+        except _BodySuppressed:
+            pass
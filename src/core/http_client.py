@@ -0,0 +1,144 @@
+import os
+import logging
+from typing import TYPE_CHECKING, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+if TYPE_CHECKING:
+    from .breaker import CircuitBreakers
+    from .ratelimit import UpstreamLimiter
+
+
+def env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def env_bool(name: str, default: bool = False) -> bool:
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def upstream_key(url: str) -> str:
+    # Pools are per scheme + host so http/https to the same host never share sockets
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class UpstreamClientPool:
+    """Application scoped httpx clients, one keep-alive pool per upstream host.
+
+    Created once in the FastAPI lifespan hook and shared by every scraper and
+    image route so connections (and TLS sessions) are reused across requests.
+    """
+
+    def __init__(self, max_connections: Optional[int] = None, max_keepalive: Optional[int] = None,
+                 keepalive_expiry: Optional[float] = None, timeout: Optional[float] = None,
+                 http2: Optional[bool] = None, breakers: Optional["CircuitBreakers"] = None):
+        self.max_connections = max_connections or env_int("HTTP_MAX_CONNECTIONS", 20)
+        self.max_keepalive = max_keepalive or env_int("HTTP_MAX_KEEPALIVE", 10)
+        self.keepalive_expiry = keepalive_expiry or env_float("HTTP_KEEPALIVE_EXPIRY", 30.0)
+        self.timeout = timeout or env_float("HTTP_TIMEOUT", 10.0)
+        http2 = env_bool("HTTP2") if http2 is None else http2
+        if http2 and not http2_available():
+            logging.warning("HTTP2 requested but the h2 package is not installed, using HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+
+        self._host_limits: Dict[str, httpx.Limits] = {}
+        # Rate / concurrency limiters (core.ratelimit.UpstreamLimiter) per upstream host
+        self._limiters: Dict[str, "UpstreamLimiter"] = {}
+        # Per host circuit breakers (core.breaker.CircuitBreakers), None disables them
+        self.breakers = breakers
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._closed = False
+
+    def configure_upstream(self, base_url: Optional[str], max_connections: Optional[int] = None,
+                           max_keepalive: Optional[int] = None):
+        """Override the connection limits for a single upstream host."""
+        if not base_url:
+            return
+        self._host_limits[upstream_key(base_url)] = httpx.Limits(
+            max_connections=max_connections or self.max_connections,
+            max_keepalive_connections=max_keepalive or min(
+                self.max_keepalive, max_connections or self.max_connections),
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def limit_upstream(self, base_url: Optional[str], limiter: Optional["UpstreamLimiter"]):
+        """Send every request to this upstream host through limiter (None removes it)."""
+        if not base_url:
+            return
+        if limiter is None:
+            self._limiters.pop(upstream_key(base_url), None)
+        else:
+            self._limiters[upstream_key(base_url)] = limiter
+
+    def connection_limit(self, base_url: str) -> int:
+        return self._limits_for(upstream_key(base_url)).max_connections
+
+    def _limits_for(self, key: str) -> httpx.Limits:
+        return self._host_limits.get(key) or httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def client_for(self, url: str) -> httpx.AsyncClient:
+        if self._closed:
+            raise RuntimeError("Upstream client pool is closed")
+        key = upstream_key(url)
+        client = self._clients.get(key)
+        if client is None:
+            client = httpx.AsyncClient(
+                limits=self._limits_for(key),
+                timeout=httpx.Timeout(self.timeout),
+                http2=self.http2,
+            )
+            self._clients[key] = client
+        return client
+
+    def circuit_open(self, url: str) -> bool:
+        return self.breakers is not None and self.breakers.is_open(url)
+
+    async def _send(self, url: str, send) -> httpx.Response:
+        limiter = self._limiters.get(upstream_key(url))
+        breaker = self.breakers.get(url) if self.breakers is not None else None
+        if breaker is not None:
+            return await breaker.call(send, limiter.call if limiter is not None else None)
+        return await (limiter.call(send) if limiter is not None else send())
+
+    async def get(self, url: str, follow_redirects: bool = False, **kwargs) -> httpx.Response:
+        client = self.client_for(url)
+        return await self._send(url, lambda: client.get(url, follow_redirects=follow_redirects, **kwargs))
+
+    async def open_stream(self, url: str, follow_redirects: bool = True, **kwargs) -> httpx.Response:
+        """Send a GET and return once headers arrive; the caller must aclose() the response."""
+        client = self.client_for(url)
+        request = client.build_request("GET", url, **kwargs)
+        return await self._send(url, lambda: client.send(request, stream=True, follow_redirects=follow_redirects))
+
+    async def aclose(self):
+        self._closed = True
+        clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logging.warning(f"Failed to close upstream client: {e}")
@@ -0,0 +1,382 @@
+import os
+import json
+import asyncio
+import hashlib
+import logging
+import tempfile
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import httpx
+from prometheus_client import Counter, Gauge
+
+from .http_client import env_int
+from .singleflight import SingleFlight
+
+IMAGE_CACHE_REQUESTS = Counter("image_cache_requests_total", "On-disk image cache lookups", ["result"])
+IMAGE_CACHE_BYTES_SAVED = Counter("image_cache_bytes_saved_total", "Image bytes served from disk instead of upstream")
+IMAGE_CACHE_HIT_RATIO = Gauge("image_cache_hit_ratio", "Share of image requests served from the disk cache")
+IMAGE_CACHE_BYTES = Gauge("image_cache_bytes", "Bytes stored in the on-disk image cache")
+
+# Upstream headers kept next to a cached image and replayed on hits
+STORED_HEADERS = ("content-type", "etag", "last-modified", "cache-control")
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+class CachedImage:
+    def __init__(self, path: str, digest: str, size: int, headers: Dict[str, str]):
+        self.path = path
+        self.digest = digest
+        self.size = size
+        self.headers = headers
+
+
+class BlobWriter:
+    """One image on its way into the cache: hashed on the event loop, written to a temp file in a thread."""
+
+    def __init__(self, cache: "DiskImageCache"):
+        self.cache = cache
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self._file = None
+        self._tmp_path: Optional[str] = None
+
+    async def open(self):
+        self._file, self._tmp_path = await asyncio.to_thread(self.cache._open_tmp)
+
+    async def write(self, chunk: bytes) -> bool:
+        """Append a chunk, False (and nothing written) once the image is over the object size limit."""
+        self.size += len(chunk)
+        if self.size > self.cache.max_object_bytes:
+            return False
+        self.digest.update(chunk)
+        await asyncio.to_thread(self._file.write, chunk)
+        return True
+
+    async def commit(self, key: str, headers: Dict[str, str]) -> CachedImage:
+        digest = self.digest.hexdigest()
+        file, self._file = self._file, None
+        await asyncio.to_thread(self.cache._place_blob, file, self._tmp_path, digest)
+        return await self.cache._commit(key, digest, self.size, headers)
+
+    async def discard(self):
+        if self._file is not None:
+            file, self._file = self._file, None
+            await asyncio.to_thread(self.cache._remove_tmp, file, self._tmp_path)
+
+
+class DiskImageCache:
+    """Content addressed image store on local disk with an LRU byte budget.
+
+    Bodies live under ``blobs/`` named by their sha256, so identical images
+    fetched through different paths are stored once. Each upstream path gets a
+    small json record under ``keys/`` pointing at its blob. Files are written
+    to a temp name and renamed into place, so readers never see partial images.
+    All file work after ``load`` runs in threads, never on the event loop.
+    """
+
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None,
+                 max_object_bytes: Optional[int] = None):
+        self.root = root or os.getenv("IMAGE_CACHE_DIR", os.path.join(".cache", "images"))
+        self.max_bytes = max_bytes if max_bytes is not None else env_int("IMAGE_CACHE_MAX_BYTES", 1024 * 1024 * 1024)
+        self.max_object_bytes = max_object_bytes if max_object_bytes is not None else env_int(
+            "IMAGE_CACHE_MAX_OBJECT_BYTES", 32 * 1024 * 1024)
+
+        self._blobs: "OrderedDict[str, int]" = OrderedDict()
+        self._keys: Dict[str, Dict] = {}
+        self._blob_keys: Dict[str, Set[str]] = {}
+        self._bytes = 0
+        self._hits = 0
+        self._lookups = 0
+        self._inflight = SingleFlight("image")
+        # Keys being written by tee, a concurrent miss for one of them is only relayed
+        self._teeing: Set[str] = set()
+        # Blobs being served or transcoded, eviction skips them until they are unpinned
+        self._pins: Dict[str, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    def _key_path(self, key_hash: str) -> str:
+        return os.path.join(self.root, "keys", key_hash[:2], f"{key_hash}.json")
+
+    @staticmethod
+    def _hash_key(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def load(self):
+        """Rebuild the in-memory index from disk, oldest access first. Blocking, run at startup."""
+        if not self.enabled:
+            return
+        # Leftovers of downloads interrupted by a restart
+        tmp_dir = os.path.join(self.root, "tmp")
+        if os.path.isdir(tmp_dir):
+            for name in os.listdir(tmp_dir):
+                try:
+                    os.unlink(os.path.join(tmp_dir, name))
+                except OSError:
+                    pass
+        blobs = []
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, "blobs")):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                stat = os.stat(path)
+                blobs.append((stat.st_mtime, name, stat.st_size))
+        for _, digest, size in sorted(blobs):
+            self._blobs[digest] = size
+            self._bytes += size
+
+        for dirpath, _, filenames in os.walk(os.path.join(self.root, "keys")):
+            for name in filenames:
+                try:
+                    with open(os.path.join(dirpath, name)) as f:
+                        record = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if record.get("digest") in self._blobs:
+                    self._index_key(name[:-len(".json")], record)
+        self._unlink(self._evict())
+        IMAGE_CACHE_BYTES.set(self._bytes)
+        logging.info(f"Image cache loaded {len(self._blobs)} images, {self._bytes} bytes from {self.root}")
+
+    def _index_key(self, key_hash: str, record: Dict):
+        previous = self._keys.get(key_hash)
+        if previous is not None:
+            self._blob_keys.get(previous["digest"], set()).discard(key_hash)
+        self._keys[key_hash] = record
+        self._blob_keys.setdefault(record["digest"], set()).add(key_hash)
+
+    def _record(self, hit: bool, size: int = 0):
+        self._lookups += 1
+        if hit:
+            self._hits += 1
+            IMAGE_CACHE_BYTES_SAVED.inc(size)
+        IMAGE_CACHE_REQUESTS.labels("hit" if hit else "miss").inc()
+        IMAGE_CACHE_HIT_RATIO.set(self._hits / self._lookups)
+
+    async def lookup(self, key: str) -> Optional[CachedImage]:
+        """The cached image of key, pinned: its file stays on disk until ``unpin``."""
+        key_hash = self._hash_key(key)
+        record = self._keys.get(key_hash)
+        if record is None or record["digest"] not in self._blobs:
+            self._record(False)
+            return None
+        digest = record["digest"]
+        path = self._blob_path(digest)
+        try:
+            await asyncio.to_thread(os.utime, path)
+        except OSError:
+            # Removed behind our back, forget about it
+            await asyncio.to_thread(self._unlink, self._drop_blob(digest))
+            self._record(False)
+            return None
+        if digest not in self._blobs:
+            # Evicted while the access time was being updated
+            self._record(False)
+            return None
+        self._blobs.move_to_end(digest)
+        self._record(True, self._blobs[digest])
+        self._pins[digest] = self._pins.get(digest, 0) + 1
+        return CachedImage(path, digest, self._blobs[digest], record["headers"])
+
+    def pin(self, image: CachedImage) -> bool:
+        """Keep image's file on disk until ``unpin``, False when it was evicted already."""
+        if image.digest not in self._blobs:
+            return False
+        self._pins[image.digest] = self._pins.get(image.digest, 0) + 1
+        return True
+
+    async def unpin(self, image: CachedImage):
+        pins = self._pins.get(image.digest, 0) - 1
+        if pins > 0:
+            self._pins[image.digest] = pins
+            return
+        self._pins.pop(image.digest, None)
+        # Eviction may have skipped it while it was pinned
+        evicted = self._evict()
+        IMAGE_CACHE_BYTES.set(self._bytes)
+        if evicted:
+            await asyncio.to_thread(self._unlink, evicted)
+
+    def contains(self, key: str) -> bool:
+        """Whether key is cached, without counting as a lookup (the prefetcher checks before downloading)."""
+        record = self._keys.get(self._hash_key(key))
+        return record is not None and record["digest"] in self._blobs
+
+    async def fill(self, key: str, open_upstream: Callable[[], Awaitable[httpx.Response]]) -> CachedImage:
+        """Download an image into the cache; concurrent fills for one key share the download.
+        The result is not pinned, ``pin`` it before reading the file."""
+        return await self._inflight.do(key, lambda: self._download(key, open_upstream))
+
+    async def _download(self, key: str, open_upstream: Callable[[], Awaitable[httpx.Response]]) -> CachedImage:
+        upstream = await open_upstream()
+        try:
+            length = upstream.headers.get("content-length")
+            if length and int(length) > self.max_object_bytes:
+                raise ImageTooLarge(key)
+            writer = BlobWriter(self)
+            await writer.open()
+            try:
+                async for chunk in upstream.aiter_bytes():
+                    if not await writer.write(chunk):
+                        raise ImageTooLarge(key)
+                return await writer.commit(key, stored_headers(upstream))
+            except BaseException:
+                await writer.discard()
+                raise
+        finally:
+            await upstream.aclose()
+
+    async def tee(self, key: str, upstream: httpx.Response) -> AsyncIterator[bytes]:
+        """Relay an upstream image (decoded) and write it into the cache on the side.
+
+        Chunks go out as they arrive from upstream, before they are written, so a
+        miss costs no time to first byte. The copy is committed once the body is complete and
+        dropped when the image is too large or the client goes away. Closes upstream.
+        """
+        length = upstream.headers.get("content-length")
+        teeing = key not in self._teeing and not (length and int(length) > self.max_object_bytes)
+        writer = BlobWriter(self) if teeing else None
+        complete = False
+        if teeing:
+            self._teeing.add(key)
+        try:
+            if writer is not None and not await self._tee_step(key, writer.open):
+                writer = None
+            async for chunk in upstream.aiter_bytes():
+                yield chunk
+                if writer is not None and not await self._tee_step(key, writer.write, chunk):
+                    await writer.discard()
+                    writer = None
+            complete = True
+        finally:
+            await upstream.aclose()
+            if teeing:
+                self._teeing.discard(key)
+            if writer is not None:
+                if complete:
+                    await self._tee_step(key, writer.commit, key, stored_headers(upstream))
+                else:
+                    await writer.discard()
+
+    @staticmethod
+    async def _tee_step(key: str, step: Callable[..., Awaitable], *args) -> bool:
+        # The client is already being answered, a disk problem only costs the cached copy
+        try:
+            return await step(*args) is not False
+        except OSError as e:
+            logging.warning(f"Not caching image {key}: {e}")
+            return False
+
+    async def fill_bytes(self, key: str, produce: Callable[[], Awaitable[Tuple[bytes, Dict[str, str]]]]) -> CachedImage:
+        """Store a derived image (e.g. a transcoded variant); concurrent fills for one key share the work."""
+        return await self._inflight.do(key, lambda: self._store(key, produce))
+
+    async def _store(self, key: str, produce: Callable[[], Awaitable[Tuple[bytes, Dict[str, str]]]]) -> CachedImage:
+        data, headers = await produce()
+        digest = hashlib.sha256(data).hexdigest()
+        await asyncio.to_thread(self._write_blob, data, digest)
+        return await self._commit(key, digest, len(data), headers)
+
+    async def _commit(self, key: str, digest: str, size: int, headers: Dict[str, str]) -> CachedImage:
+        record = {"key": key, "digest": digest, "headers": headers}
+        key_hash = self._hash_key(key)
+        await asyncio.to_thread(self._write_record, key_hash, record)
+
+        if digest not in self._blobs:
+            self._bytes += size
+        self._blobs[digest] = size
+        self._blobs.move_to_end(digest)
+        self._index_key(key_hash, record)
+        evicted = self._evict()
+        IMAGE_CACHE_BYTES.set(self._bytes)
+        if evicted:
+            await asyncio.to_thread(self._unlink, evicted)
+        return CachedImage(self._blob_path(digest), digest, size, headers)
+
+    # Blocking file helpers, called through asyncio.to_thread
+
+    def _open_tmp(self):
+        tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        return os.fdopen(fd, "wb"), tmp_path
+
+    def _place_blob(self, file, tmp_path: str, digest: str):
+        try:
+            file.close()
+            blob_path = self._blob_path(digest)
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(tmp_path, blob_path)
+        except BaseException:
+            self._remove_tmp(file, tmp_path)
+            raise
+
+    @staticmethod
+    def _remove_tmp(file, tmp_path: str):
+        file.close()
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+    def _write_blob(self, data: bytes, digest: str):
+        file, tmp_path = self._open_tmp()
+        try:
+            file.write(data)
+        except BaseException:
+            self._remove_tmp(file, tmp_path)
+            raise
+        self._place_blob(file, tmp_path, digest)
+
+    def _write_record(self, key_hash: str, record: Dict):
+        key_path = self._key_path(key_hash)
+        os.makedirs(os.path.dirname(key_path), exist_ok=True)
+        file, tmp_path = self._open_tmp()
+        with file:
+            file.write(json.dumps(record).encode())
+        os.replace(tmp_path, key_path)
+
+    @staticmethod
+    def _unlink(paths: List[str]):
+        for path in paths:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def _evict(self) -> List[str]:
+        """Drop least recently used blobs until the budget fits, returns the files to delete."""
+        paths = []
+        # The most recent blob always stays, it was just stored or looked up for a request
+        for digest in list(self._blobs)[:-1]:
+            if self._bytes <= self.max_bytes:
+                break
+            if digest in self._pins:
+                continue
+            paths += self._drop_blob(digest)
+            paths.append(self._blob_path(digest))
+        return paths
+
+    def _drop_blob(self, digest: str) -> List[str]:
+        """Forget a blob and the keys pointing at it, returns their record files to delete."""
+        size = self._blobs.pop(digest, None)
+        if size is not None:
+            self._bytes -= size
+        IMAGE_CACHE_BYTES.set(self._bytes)
+        key_paths = []
+        for key_hash in self._blob_keys.pop(digest, set()):
+            self._keys.pop(key_hash, None)
+            key_paths.append(self._key_path(key_hash))
+        return key_paths
+
+
+def stored_headers(upstream: httpx.Response) -> Dict[str, str]:
+    return {name: upstream.headers[name] for name in STORED_HEADERS if name in upstream.headers}
@@ -0,0 +1,327 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional
+
+import httpx
+from fastapi import HTTPException
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from prometheus_client import Counter, Histogram
+
+from .http_client import UpstreamClientPool, env_int, upstream_key
+from .image_cache import CachedImage, DiskImageCache, ImageTooLarge
+from .ratelimit import UpstreamOverloaded, upstream_error
+from .transcode import ImageVariant, Transcoder, TranscodeError
+
+IMAGE_CHUNK_SIZE = env_int("IMAGE_CHUNK_SIZE", 64 * 1024)
+# Fixed hedge delay in ms, 0 means use the observed p95 of the mirror being waited on
+IMAGE_HEDGE_DELAY_MS = env_int("IMAGE_HEDGE_DELAY_MS", 0)
+
+IMAGE_UPSTREAM_LATENCY = Histogram(
+    "image_upstream_latency_seconds", "Time until an image upstream answered with headers", ["upstream"])
+IMAGE_HEDGED_REQUESTS = Counter("image_hedged_requests_total", "Extra image requests raced against a slow mirror")
+
+# Upstream headers forwarded to the client. Content-Encoding has to travel with
+# Content-Length because the body is relayed raw, without decoding.
+PASSTHROUGH_HEADERS = ("content-length", "content-encoding", "etag", "last-modified", "cache-control")
+# Set when ?w= / ?q= / ?format= were asked for but the original image is served
+VARIANT_HEADER = "x-image-variant"
+
+
+class MirrorStats:
+    """Rolling time-to-headers samples and failure rate per image upstream.
+
+    Drives both the order in which mirrors are tried and how long the primary
+    gets before a hedged request is raced against the next mirror.
+    """
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._failures: Dict[str, float] = {}
+
+    def observe(self, url: str, seconds: Optional[float]):
+        key = upstream_key(url)
+        if seconds is None:
+            self._failures[key] = self._failures.get(key, 0.0) * 0.9 + 1.0
+            return
+        self._failures[key] = self._failures.get(key, 0.0) * 0.9
+        self._latencies.setdefault(key, deque(maxlen=self.window)).append(seconds)
+        IMAGE_UPSTREAM_LATENCY.labels(key).observe(seconds)
+
+    def p95(self, url: str) -> Optional[float]:
+        samples = self._latencies.get(upstream_key(url))
+        if not samples or len(samples) < 10:
+            return None
+        ordered = sorted(samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def score(self, url: str) -> float:
+        samples = self._latencies.get(upstream_key(url))
+        latency = sum(samples) / len(samples) if samples else 0.0
+        # Each recent failure costs as much as a slow second
+        return latency + self._failures.get(upstream_key(url), 0.0)
+
+    def order(self, urls: List[str]) -> List[str]:
+        # sorted() is stable, so untested mirrors keep the configured CDN-first order
+        return sorted(urls, key=self.score)
+
+    def hedge_delay(self, url: str) -> float:
+        if IMAGE_HEDGE_DELAY_MS > 0:
+            return IMAGE_HEDGE_DELAY_MS / 1000
+        p95 = self.p95(url)
+        return max(p95, 0.05) if p95 is not None else 0.3
+
+
+mirror_stats = MirrorStats()
+
+
+async def attempt(http: UpstreamClientPool, url: str) -> httpx.Response:
+    started = time.monotonic()
+    try:
+        response = await http.open_stream(url)
+    except httpx.RequestError:
+        mirror_stats.observe(url, None)
+        raise
+    except asyncio.CancelledError:
+        # Lost a hedge race, it took at least this long
+        mirror_stats.observe(url, time.monotonic() - started)
+        raise
+    if response.status_code != 200:
+        await response.aclose()
+        mirror_stats.observe(url, None)
+        raise httpx.HTTPStatusError(
+            f"{response.status_code} from {url}", request=response.request, response=response)
+    mirror_stats.observe(url, time.monotonic() - started)
+    return response
+
+
+async def open_image(http: UpstreamClientPool, image_urls: List[str]) -> httpx.Response:
+    """Return the first streamed 200 response from image_urls.
+
+    Mirrors are tried fastest first. When the current one has not answered
+    within its hedge delay the next mirror is started as well, the first 200
+    wins and the others are cancelled. When every mirror was refused by its
+    circuit breaker or rate limit the error is a retryable 503, not a 404.
+    """
+    remaining = mirror_stats.order([url for url in image_urls if url])
+    # Skip mirrors whose circuit is open, unless that leaves nothing to try
+    remaining = [url for url in remaining if not http.circuit_open(url)] or remaining
+    pending: Dict[asyncio.Task, str] = {}
+    # Set while every failure so far was our own throttling, not the mirror answering
+    overloaded: Optional[UpstreamOverloaded] = None
+    other_failure = False
+    last_started = None
+    start_next = True
+    try:
+        while remaining or pending:
+            if start_next and remaining:
+                url = remaining.pop(0)
+                if pending:
+                    IMAGE_HEDGED_REQUESTS.inc()
+                pending[asyncio.ensure_future(attempt(http, url))] = url
+                last_started = url
+
+            timeout = mirror_stats.hedge_delay(last_started) if remaining else None
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                # Slow mirror, race the next one against it
+                start_next = True
+                continue
+            winner = None
+            for task in done:
+                del pending[task]
+                error = task.exception()
+                if error is None:
+                    if winner is None:
+                        winner = task.result()
+                    else:
+                        await task.result().aclose()
+                elif isinstance(error, UpstreamOverloaded):
+                    overloaded = error
+                else:
+                    other_failure = True
+            if winner is not None:
+                return winner
+            # Failed outright, fall through to the next mirror unless a hedge is still running
+            start_next = not pending
+    finally:
+        for task in pending:
+            task.cancel()
+            task.add_done_callback(close_late_winner)
+    if overloaded is not None and not other_failure:
+        raise upstream_error(overloaded)
+    raise HTTPException(
+        status_code=404, detail="Failed to fetch image from all sources")
+
+
+def close_late_winner(task: asyncio.Task):
+    # A cancelled hedge may still have produced a response before it noticed
+    if not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(task.result().aclose())
+
+
+async def relay(upstream: httpx.Response, chunk_size: int = IMAGE_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    # The finally block also runs when the client disconnects mid image and the
+    # response task gets cancelled, so the upstream connection always goes back to the pool
+    try:
+        async for chunk in upstream.aiter_raw(chunk_size):
+            yield chunk
+    finally:
+        await upstream.aclose()
+
+
+class UpstreamStreamingResponse(StreamingResponse):
+    """StreamingResponse that always releases its upstream, even if sending is aborted
+    before the body iterator is exhausted (e.g. a 304 answered by the cache middleware)."""
+
+    def __init__(self, upstream: httpx.Response, body: Optional[AsyncIterator[bytes]] = None, **kwargs):
+        super().__init__(body if body is not None else relay(upstream), **kwargs)
+        self.upstream = upstream
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Runs the body's cleanup now (e.g. dropping a half written cache copy), not whenever it is collected
+            await self.body_iterator.aclose()
+            await self.upstream.aclose()
+
+
+def stream_image(upstream: httpx.Response, cache: Optional[DiskImageCache] = None,
+                 key: Optional[str] = None) -> StreamingResponse:
+    """Relay an upstream image, with a cache it is also written to disk while it streams."""
+    headers = {name: upstream.headers[name] for name in PASSTHROUGH_HEADERS if name in upstream.headers}
+    body = None
+    if cache is not None:
+        # The cached copy is stored decoded, so the client gets the decoded body too
+        if headers.pop("content-encoding", None):
+            headers.pop("content-length", None)
+        body = cache.tee(key, upstream)
+    return UpstreamStreamingResponse(upstream, body, media_type=upstream.headers.get("content-type"), headers=headers)
+
+
+async def proxy_image(http: UpstreamClientPool, image_urls: List[str]) -> StreamingResponse:
+    return stream_image(await open_image(http, image_urls))
+
+
+class CachedFileResponse(FileResponse):
+    """FileResponse of a pinned cache blob, unpinned once it was sent (or sending failed),
+    so a concurrent eviction cannot delete the file before it is opened."""
+
+    def __init__(self, cache: DiskImageCache, image: CachedImage, **kwargs):
+        super().__init__(image.path, **kwargs)
+        self.cache = cache
+        self.image = image
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.cache.unpin(self.image)
+
+
+def cached_image_response(cache: DiskImageCache, image: CachedImage) -> FileResponse:
+    """Response for a pinned image, takes over the pin."""
+    headers = {name: value for name, value in image.headers.items() if name != "content-type"}
+    # Content addressed, so the digest is a strong validator when upstream sent none
+    headers.setdefault("etag", f'"{image.digest}"')
+    return CachedFileResponse(cache, image, media_type=image.headers.get("content-type"), headers=headers)
+
+
+def variant_skipped(response: Response, reason: str) -> Response:
+    response.headers[VARIANT_HEADER] = f"original; reason={reason}"
+    return response
+
+
+async def resume(prefix: List[bytes], rest: AsyncIterator[bytes], upstream: httpx.Response) -> AsyncIterator[bytes]:
+    try:
+        for chunk in prefix:
+            yield chunk
+        async for chunk in rest:
+            yield chunk
+    finally:
+        await upstream.aclose()
+
+
+async def transcode_upstream(http: UpstreamClientPool, image_urls: List[str], variant: ImageVariant,
+                             transcoder: Transcoder) -> Response:
+    """Transcode an image straight from memory, for when there is no disk cache to keep it in."""
+    upstream = await open_image(http, image_urls)
+    headers = {name: upstream.headers[name] for name in PASSTHROUGH_HEADERS
+               if name in upstream.headers and name not in ("content-length", "content-encoding")}
+    media_type = upstream.headers.get("content-type")
+    chunks, size = [], 0
+    body = upstream.aiter_bytes()
+    try:
+        async for chunk in body:
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > transcoder.max_source_bytes:
+                # Too big to hold on to, pass on what was read and the rest as it comes
+                return variant_skipped(UpstreamStreamingResponse(
+                    upstream, resume(chunks, body, upstream), media_type=media_type, headers=headers), "too-large")
+    except BaseException:
+        await upstream.aclose()
+        raise
+    await upstream.aclose()
+
+    data = b"".join(chunks)
+    try:
+        transcoded, out_headers = await transcoder.transcode(data, variant, dict(upstream.headers))
+    except TranscodeError as e:
+        logging.warning(f"Serving original {upstream.url}, transcoding failed: {e}")
+        return variant_skipped(Response(data, media_type=media_type, headers=headers), "transcode-failed")
+    return Response(transcoded, media_type=out_headers.pop("content-type"), headers=out_headers)
+
+
+async def serve_image(http: UpstreamClientPool, cache: Optional[DiskImageCache], key: str, image_urls: List[str],
+                      variant: Optional[ImageVariant] = None, transcoder: Optional[Transcoder] = None) -> Response:
+    """Serve an image from the disk cache. A miss is streamed to the client and into the cache at once.
+
+    With a variant the resized / re-encoded copy is cached next to the original,
+    which then has to be downloaded completely before transcoding. Without the
+    disk cache the variant is transcoded from memory. When the variant cannot
+    be produced (no opencv, source too large, transcoding failed) the original
+    is served with an ``X-Image-Variant: original; reason=...`` header.
+    """
+    if variant is not None and (transcoder is None or not transcoder.available):
+        return variant_skipped(await serve_image(http, cache, key, image_urls), "unavailable")
+    if cache is None or not cache.enabled:
+        if variant is not None:
+            return await transcode_upstream(http, image_urls, variant, transcoder)
+        return await proxy_image(http, image_urls)
+    if variant is not None:
+        cached = await cache.lookup(variant.cache_key(key))
+        if cached is not None:
+            return cached_image_response(cache, cached)
+
+    original = await cache.lookup(key)
+    if original is None and variant is None:
+        return stream_image(await open_image(http, image_urls), cache, key)
+    if original is None:
+        try:
+            original = await cache.fill(key, lambda: open_image(http, image_urls))
+        except ImageTooLarge:
+            return variant_skipped(await proxy_image(http, image_urls), "too-large")
+        if not cache.pin(original):
+            # Evicted again by a concurrent fill, only happens with a tiny budget
+            return variant_skipped(await proxy_image(http, image_urls), "evicted")
+    if variant is None:
+        return cached_image_response(cache, original)
+
+    try:
+        cached = await cache.fill_bytes(
+            variant.cache_key(key), lambda: transcoder.transcode(original.path, variant, original.headers))
+    except TranscodeError as e:
+        logging.warning(f"Serving original {key}, transcoding failed: {e}")
+        return variant_skipped(cached_image_response(cache, original), "transcode-failed")
+    except BaseException:
+        await cache.unpin(original)
+        raise
+    if not cache.pin(cached):
+        return variant_skipped(cached_image_response(cache, original), "evicted")
+    await cache.unpin(original)
+    return cached_image_response(cache, cached)
@@ -0,0 +1,148 @@
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from bs4 import BeautifulSoup, SoupStrainer
+from prometheus_client import Histogram
+
+from .http_client import env_bool, env_int
+
+PARSE_SECONDS = Histogram("html_parse_seconds", "Time spent parsing and extracting upstream html", ["function"])
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "How late the event loop woke up a periodic timer, i.e. how long it was blocked",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+
+EXECUTOR_KINDS = ("thread", "process", "inline")
+HTML_PARSERS = ("lxml", "html.parser")
+
+
+def lxml_available() -> bool:
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_html_parser(name: str) -> str:
+    if name not in HTML_PARSERS:
+        logging.warning(f"Unknown HTML_PARSER {name}, using html.parser")
+        return "html.parser"
+    if name == "lxml" and not lxml_available():
+        logging.warning("lxml is not installed, using html.parser")
+        return "html.parser"
+    return name
+
+
+# BeautifulSoup tree builder used by every scraper. Read at import so worker processes agree with the parent.
+HTML_PARSER = resolve_html_parser(os.getenv("HTML_PARSER", "lxml"))
+PARTIAL_PARSE = env_bool("HTML_PARTIAL_PARSE", True)
+
+
+class PageParts(SoupStrainer):
+    """The subtrees of a page an extraction function reads.
+
+    Only elements carrying one of ``classes``, ``ids`` or exact ``attrs`` are
+    built, each with everything inside it; the rest of the page is skipped by
+    the parser. Selectors rooted at one of those (``.chapter-name``,
+    ``#episode_page li a``) find the same elements as on the full tree.
+    """
+
+    def __init__(self, classes: Iterable[str] = (), ids: Iterable[str] = (), attrs: Optional[Dict[str, str]] = None):
+        super().__init__()
+        self.classes = frozenset(classes)
+        self.ids = frozenset(ids)
+        self.attrs = attrs or {}
+
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+        if not attrs:
+            return False
+        if attrs.get("id") in self.ids:
+            return True
+        if any(attrs.get(attr) == value for attr, value in self.attrs.items()):
+            return True
+        # Not split into a list yet while parsing
+        classes = attrs.get("class")
+        if not classes:
+            return False
+        return not self.classes.isdisjoint(classes.split() if isinstance(classes, str) else classes)
+
+    def allow_string_creation(self, string: str) -> bool:
+        # Text between the wanted elements
+        return False
+
+
+def make_soup(html: str, parts: Optional[PageParts] = None) -> BeautifulSoup:
+    return BeautifulSoup(html, HTML_PARSER, parse_only=parts if PARTIAL_PARSE else None)
+
+
+class ParseExecutor:
+    """Runs the scrapers' html extraction functions off the event loop.
+
+    ``process`` (the default) parses pages in parallel without holding the
+    event loop's GIL, so functions and their results must be picklable and
+    extraction lives in module level functions. ``thread`` avoids the pickling
+    but still competes with the loop for the GIL, and ``inline`` parses on
+    the loop like before.
+    """
+
+    def __init__(self, kind: Optional[str] = None, workers: Optional[int] = None):
+        self.kind = kind or os.getenv("PARSE_EXECUTOR", "process")
+        if self.kind not in EXECUTOR_KINDS:
+            logging.warning(f"Unknown PARSE_EXECUTOR {self.kind}, parsing in worker processes")
+            self.kind = "process"
+        self.workers = workers if workers is not None else env_int("PARSE_WORKERS", min(4, os.cpu_count() or 1))
+        if self.workers <= 0:
+            self.kind = "inline"
+
+        self._executor: Optional[Executor] = None
+        if self.kind == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="parse")
+        elif self.kind == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        with PARSE_SECONDS.labels(fn.__name__).time():
+            if self._executor is None:
+                return fn(*args)
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class EventLoopMonitor:
+    """Samples how long the event loop is blocked by sleeping a fixed interval and measuring the overshoot."""
+
+    def __init__(self, interval: Optional[float] = None, slow_threshold: Optional[float] = None):
+        self.interval = interval if interval is not None else env_int("EVENT_LOOP_MONITOR_INTERVAL_MS", 100) / 1000
+        self.slow_threshold = slow_threshold if slow_threshold is not None else env_int(
+            "EVENT_LOOP_SLOW_MS", 250) / 1000
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - started - self.interval)
+            EVENT_LOOP_LAG.observe(lag)
+            if lag >= self.slow_threshold:
+                logging.warning(f"Event loop was blocked for {lag * 1000:.0f}ms")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
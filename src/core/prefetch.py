@@ -0,0 +1,141 @@
+import re
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from prometheus_client import Counter
+
+from .http_client import UpstreamClientPool, env_bool, env_int
+from .image_cache import DiskImageCache, ImageTooLarge
+from .image_proxy import open_image
+
+PREFETCH_JOBS = Counter("prefetch_jobs_total", "Next chapter prefetches by outcome", ["outcome"])
+PREFETCH_FETCHES = Counter("prefetch_fetches_total", "Upstream fetches made by the prefetcher", ["kind"])
+
+CHAPTER_NUMBER = re.compile(r"(\d+(?:\.\d+)?)")
+
+
+def chapter_number(chapter_id: Optional[str]) -> Optional[float]:
+    match = CHAPTER_NUMBER.search(chapter_id or "")
+    return float(match.group(1)) if match else None
+
+
+def next_chapter_id(chapters: List[Dict[str, Any]], chapter_id: str) -> Optional[str]:
+    """The chapter read after chapter_id in a manga's chapter list, None for the latest one."""
+    ids = [chapter.get("chapterId") for chapter in chapters]
+    if chapter_id not in ids:
+        return None
+    # Sites list the newest chapter first, unless the numbers say otherwise
+    first, last = chapter_number(ids[0]), chapter_number(ids[-1])
+    step = 1 if first is not None and last is not None and first < last else -1
+    index = ids.index(chapter_id) + step
+    return ids[index] if 0 <= index < len(ids) else None
+
+
+class Prefetcher:
+    """Warms the caches for the chapter after the one just served: its html and its first few images.
+
+    Jobs go to a small queue worked by a few background tasks that wait a
+    moment first, so the reader's own requests for the current chapter's
+    images get the upstream connections. A global budget caps the upstream
+    fetches per minute; jobs over budget or beyond a full queue are dropped.
+    """
+
+    def __init__(self, http: UpstreamClientPool, image_cache: Optional[DiskImageCache] = None,
+                 enabled: Optional[bool] = None, images: Optional[int] = None, workers: Optional[int] = None,
+                 budget: Optional[int] = None, queue_size: Optional[int] = None, delay: Optional[float] = None):
+        self.http = http
+        self.image_cache = image_cache
+        self.enabled = enabled if enabled is not None else env_bool("PREFETCH", False)
+        self.images = images if images is not None else env_int("PREFETCH_IMAGES", 4)
+        self.workers = workers if workers is not None else env_int("PREFETCH_WORKERS", 1)
+        # Upstream fetches per minute across all prefetches
+        self.budget = budget if budget is not None else env_int("PREFETCH_BUDGET", 120)
+        self.delay = delay if delay is not None else env_int("PREFETCH_DELAY_MS", 500) / 1000
+        self._queue: asyncio.Queue = asyncio.Queue(
+            maxsize=queue_size if queue_size is not None else env_int("PREFETCH_QUEUE", 32))
+        self._recent: "OrderedDict[Tuple[str, str, str], None]" = OrderedDict()
+        self._window_started = 0.0
+        self._spent = 0
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        if self.enabled and not self._tasks:
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(max(1, self.workers))]
+
+    def schedule(self, entry, manga_id: str, chapter_id: str):
+        """Queue a prefetch of the chapter after chapter_id, never blocks the caller."""
+        if not self._tasks:
+            return
+        key = (entry.name, manga_id, chapter_id)
+        if key in self._recent:
+            return
+        self._recent[key] = None
+        if len(self._recent) > 1024:
+            self._recent.popitem(last=False)
+        try:
+            self._queue.put_nowait((entry, manga_id, chapter_id))
+            PREFETCH_JOBS.labels("queued").inc()
+        except asyncio.QueueFull:
+            PREFETCH_JOBS.labels("dropped").inc()
+
+    def _spend(self, kind: str) -> bool:
+        now = time.monotonic()
+        if now - self._window_started >= 60:
+            self._window_started, self._spent = now, 0
+        if self._spent >= self.budget:
+            return False
+        self._spent += 1
+        PREFETCH_FETCHES.labels(kind).inc()
+        return True
+
+    async def _work(self):
+        while True:
+            entry, manga_id, chapter_id = await self._queue.get()
+            try:
+                await asyncio.sleep(self.delay)
+                PREFETCH_JOBS.labels(await self.prefetch(entry, manga_id, chapter_id)).inc()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.info(f"Prefetch after {entry.name} {manga_id}/{chapter_id} failed: {e}")
+                PREFETCH_JOBS.labels("failed").inc()
+            finally:
+                self._queue.task_done()
+
+    async def prefetch(self, entry, manga_id: str, chapter_id: str) -> str:
+        scraper = entry.scraper
+        # Usually memoized already, the chapter route embeds the manga details
+        manga = await scraper.get_manga_details_cached(manga_id)
+        next_id = next_chapter_id(manga.get("chapters") or [], chapter_id)
+        if next_id is None:
+            return "latest"
+        if not self._spend("html"):
+            return "over_budget"
+        chapter = await scraper.get_chapter_details(manga_id=manga_id, chapter_id=next_id, include_manga=False)
+
+        if self.image_cache is None or not self.image_cache.enabled:
+            return "done"
+        for image in (chapter.get("images") or [])[:self.images]:
+            path = urlparse(image.get("imageUrl") or "").path
+            # Same key the image routes use: server + upstream path
+            key = f"{entry.name}{path}"
+            if not path or self.image_cache.contains(key):
+                continue
+            if not self._spend("image"):
+                return "over_budget"
+            image_urls = [f"{base_url}{path}" for base_url in entry.image_base_urls]
+            try:
+                await self.image_cache.fill(key, lambda: open_image(self.http, image_urls))
+            except ImageTooLarge:
+                continue
+        return "done"
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
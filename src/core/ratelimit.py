@@ -0,0 +1,256 @@
+import os
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+import httpx
+from fastapi import HTTPException
+from prometheus_client import Counter, Gauge
+
+from .http_client import env_bool, env_float, env_int
+
+UPSTREAM_CONCURRENCY_LIMIT = Gauge(
+    "upstream_concurrency_limit", "Current concurrency limit per upstream", ["upstream"])
+UPSTREAM_INFLIGHT = Gauge("upstream_inflight_requests", "Requests in flight per upstream", ["upstream"])
+UPSTREAM_REJECTED = Counter(
+    "upstream_rejected_total", "Requests that gave up waiting for an upstream slot", ["upstream", "reason"])
+UPSTREAM_OVERLOAD_SIGNALS = Counter(
+    "upstream_overload_signals_total", "429/503 answers and timeouts seen per upstream", ["upstream"])
+
+# Upstream answers that mean "slow down"
+OVERLOAD_STATUS = (429, 503)
+
+
+class UpstreamOverloaded(Exception):
+    """No rate limit token or concurrency slot for an upstream within the queue deadline."""
+
+    def __init__(self, upstream: str, reason: str, retry_after: float = 1.0):
+        super().__init__(f"{upstream} is overloaded ({reason}), try again in {math.ceil(retry_after)}s")
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def upstream_error(e: Exception) -> HTTPException:
+    """HTTP error for a failed scraper call: throttling (ours or the upstream's) is a retryable 503."""
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, UpstreamOverloaded):
+        return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+    if isinstance(e, httpx.HTTPStatusError) and e.response.status_code in OVERLOAD_STATUS:
+        retry_after = e.response.headers.get("retry-after", "1")
+        return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": retry_after})
+    return HTTPException(status_code=500, detail=str(e))
+
+
+def retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        # HTTP-date form, not worth parsing for a pause hint
+        return None
+
+
+class TokenBucket:
+    """``rate`` requests per second with bursts up to ``burst``, waiters are served in order."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.burst = burst or max(1, math.ceil(rate))
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def pause(self, seconds: float):
+        """Hand out nothing for ``seconds`` (the upstream sent Retry-After)."""
+        self.tokens = 0.0
+        self.updated = max(self.updated, time.monotonic() + seconds)
+
+    def wait_time(self, now: float) -> float:
+        return max(0.0, self.updated - now) + max(0.0, 1 - self.tokens) / self.rate
+
+    async def acquire(self, deadline: float):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1 and now >= self.updated:
+                    self.tokens -= 1
+                    return
+                wait = self.wait_time(now)
+                if now + wait > deadline:
+                    raise asyncio.TimeoutError()
+                await asyncio.sleep(wait)
+
+
+class AdaptiveLimit:
+    """Concurrency limit for one upstream, optionally tuned with AIMD.
+
+    Every request that finishes fast and without an overload signal raises the
+    limit by 1/limit (about +1 per limit's worth of requests). A 429/503, a
+    timeout or a response slower than ``latency_target`` multiplies it by
+    ``backoff``, at most once per ``cooldown`` so a burst of failures from the
+    same overload only counts once.
+    """
+
+    def __init__(self, name: str, limit: int, min_limit: int = 1, max_limit: Optional[int] = None,
+                 adaptive: bool = False, latency_target: float = 3.0, backoff: float = 0.7, cooldown: float = 1.0):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(max_limit or limit, self.min_limit)
+        self.limit = float(min(max(limit, self.min_limit), self.max_limit))
+        self.adaptive = adaptive
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.inflight = 0
+        self._last_decrease = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+        UPSTREAM_CONCURRENCY_LIMIT.labels(name).set(self.limit)
+
+    async def acquire(self, timeout: float):
+        if not self._waiters and self.inflight < int(self.limit):
+            self.inflight += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except BaseException:
+                if waiter.done() and not waiter.cancelled():
+                    # Handed a slot just as we gave up, pass it on
+                    self.inflight -= 1
+                    self._wake()
+                elif waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                raise
+        UPSTREAM_INFLIGHT.labels(self.name).set(self.inflight)
+
+    def release(self, latency: float, overloaded: bool):
+        # Synchronous so it also runs to completion in a cancelled request's finally block
+        self.inflight -= 1
+        if self.adaptive:
+            self._adjust(latency, overloaded)
+        self._wake()
+        UPSTREAM_INFLIGHT.labels(self.name).set(self.inflight)
+
+    def _wake(self):
+        # Slots are handed over in arrival order, so a waiter is never overtaken by a new request
+        while self._waiters and self.inflight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.inflight += 1
+                waiter.set_result(None)
+
+    def _adjust(self, latency: float, overloaded: bool):
+        if overloaded or latency > self.latency_target:
+            now = time.monotonic()
+            if now - self._last_decrease < self.cooldown:
+                return
+            self._last_decrease = now
+            limit = max(self.min_limit, self.limit * self.backoff)
+            if int(limit) < int(self.limit):
+                logging.info(f"Lowering {self.name} concurrency limit to {int(limit)}")
+        else:
+            limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self.limit = limit
+        UPSTREAM_CONCURRENCY_LIMIT.labels(self.name).set(self.limit)
+
+
+class UpstreamLimiter:
+    """Token bucket and concurrency limit in front of one upstream host.
+
+    A request waits for a token and then a slot, together at most
+    ``queue_timeout`` seconds, otherwise it fails with UpstreamOverloaded
+    instead of piling up behind an upstream that is already struggling.
+    """
+
+    def __init__(self, name: str, rate: float = 0, burst: Optional[int] = None, concurrency: int = 0,
+                 adaptive: bool = False, min_concurrency: int = 1, max_concurrency: Optional[int] = None,
+                 queue_timeout: float = 2.0, latency_target: float = 3.0):
+        self.name = name
+        self.queue_timeout = queue_timeout
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.concurrency = AdaptiveLimit(
+            name, concurrency or max_concurrency or 1, min_concurrency, max_concurrency, adaptive,
+            latency_target) if concurrency > 0 or adaptive else None
+
+    @classmethod
+    def from_config(cls, name: str, upstream: str, config: Optional[Dict[str, Any]],
+                    max_connections: int) -> Optional["UpstreamLimiter"]:
+        """Limiter for a server_map entry's ``limits``, overridden by ``<NAME>_RATE_LIMIT`` etc. env vars.
+
+        Returns None when the upstream is not limited at all.
+        """
+        config = config or {}
+
+        def setting(key: str, env: str, default, parse):
+            value = os.getenv(f"{name}_{env}")
+            if value:
+                return parse(value)
+            return config.get(key, default)
+
+        rate = setting("rate", "RATE_LIMIT", env_float("UPSTREAM_RATE_LIMIT", 0), float)
+        burst = setting("burst", "RATE_BURST", env_int("UPSTREAM_RATE_BURST", 0), int)
+        concurrency = setting("concurrency", "CONCURRENCY", env_int("UPSTREAM_CONCURRENCY", 0), int)
+        adaptive = setting("adaptive", "ADAPTIVE", env_bool("UPSTREAM_ADAPTIVE", False),
+                           lambda value: value.strip().lower() in ("1", "true", "yes", "on"))
+        if rate <= 0 and concurrency <= 0 and not adaptive:
+            return None
+        return cls(
+            upstream, rate=rate, burst=burst or None, concurrency=concurrency, adaptive=adaptive,
+            min_concurrency=setting("min_concurrency", "MIN_CONCURRENCY", 1, int),
+            # More than the connection pool allows would only queue inside httpx
+            max_concurrency=max_connections,
+            queue_timeout=setting("queue_timeout_ms", "QUEUE_TIMEOUT_MS",
+                                  env_int("UPSTREAM_QUEUE_TIMEOUT_MS", 2000), int) / 1000,
+            latency_target=setting("latency_target_ms", "LATENCY_TARGET_MS",
+                                   env_int("UPSTREAM_LATENCY_TARGET_MS", 3000), int) / 1000,
+        )
+
+    async def call(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """Send a request once a token and a slot are free.
+
+        For streamed responses the slot covers the time until headers arrive.
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        if self.bucket is not None:
+            try:
+                await self.bucket.acquire(deadline)
+            except asyncio.TimeoutError:
+                UPSTREAM_REJECTED.labels(self.name, "rate").inc()
+                raise UpstreamOverloaded(self.name, "rate limited", self.bucket.wait_time(time.monotonic()))
+        if self.concurrency is not None:
+            try:
+                await self.concurrency.acquire(max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                UPSTREAM_REJECTED.labels(self.name, "concurrency").inc()
+                raise UpstreamOverloaded(self.name, "too many requests in flight")
+
+        started = time.monotonic()
+        overloaded = False
+        try:
+            response = await send()
+            if response.status_code in OVERLOAD_STATUS:
+                overloaded = True
+                pause = retry_after_seconds(response)
+                if pause and self.bucket is not None:
+                    self.bucket.pause(min(pause, 60.0))
+            return response
+        except httpx.TimeoutException:
+            overloaded = True
+            raise
+        finally:
+            if overloaded:
+                UPSTREAM_OVERLOAD_SIGNALS.labels(self.name).inc()
+            if self.concurrency is not None:
+                self.concurrency.release(time.monotonic() - started, overloaded)
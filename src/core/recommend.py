@@ -0,0 +1,238 @@
+import os
+import math
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from .federated import normalize_title
+from .http_client import env_bool, env_float, env_int
+from .search_index import AUTHOR_KEYS, GENRE_KEYS, as_list, first_value
+
+try:
+    import lancedb
+    import numpy as np
+    from lancedb.index import IvfPq
+except ImportError:  # lancedb is optional, /similar answers 503 without it
+    lancedb = None
+
+RECOMMEND_TITLES = Gauge("recommend_titles", "Titles in the recommendation vector table")
+RECOMMEND_EMBEDDED = Counter("recommend_embedded_total", "Titles embedded into the vector table")
+RECOMMEND_QUERIES = Counter("recommend_queries_total", "Similar title lookups", ["result"])
+RECOMMEND_SECONDS = Histogram(
+    "recommend_query_seconds", "Time to answer a similar title lookup",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+
+TABLE = "titles"
+# Words too common in blurbs to say anything about a title
+STOPWORDS = frozenset("""a an and are as at be but by for from has he her his in is it its of on or she that the
+their they this to was were will with who him them you your not no he's one all into out up""".split())
+# Genres and authors say more about what a title is like than single words of its description
+GENRE_WEIGHT = 3.0
+AUTHOR_WEIGHT = 2.0
+
+TitleKey = Tuple[str, str, str]
+# Keys the scrapers use for the blurb (anime details call it summary)
+DESCRIPTION_KEYS = ("description", "summary")
+
+
+def features(details: Dict[str, Any]) -> Dict[str, float]:
+    """Weighted features of a title: description words and word pairs, genres and authors.
+
+    Genres and authors come as lists or comma separated strings depending on the scraper.
+    """
+    weights: Dict[str, float] = {}
+    words = [word for word in normalize_title(first_value(details, DESCRIPTION_KEYS) or "").split()
+             if len(word) > 2 and word not in STOPWORDS]
+    for feature in [*words, *(f"{a} {b}" for a, b in zip(words, words[1:]))]:
+        weights[f"w:{feature}"] = weights.get(f"w:{feature}", 0.0) + 1.0
+    # Long descriptions should not drown the genres, damp repeated words
+    weights = {feature: 1.0 + math.log(count) for feature, count in weights.items()}
+    for genre in as_list(first_value(details, GENRE_KEYS)):
+        weights[f"g:{normalize_title(genre)}"] = GENRE_WEIGHT
+    for author in as_list(first_value(details, AUTHOR_KEYS)):
+        weights[f"a:{normalize_title(author)}"] = AUTHOR_WEIGHT
+    return weights
+
+
+def embed(weights: Dict[str, float], dims: int) -> "np.ndarray":
+    """Hashing trick: every feature adds its weight to one signed dimension, the result is L2 normalized.
+
+    blake2b instead of ``hash`` so the vectors stay the same across restarts (``hash`` is salted per process).
+    """
+    vector = np.zeros(dims, dtype=np.float32)
+    for feature, weight in weights.items():
+        digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+        vector[digest % dims] += weight if digest >> 63 else -weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class Recommender:
+    """Similar titles from a LanceDB vector table of the titles' descriptions, genres and authors.
+
+    The scrapers hand every ``get_manga_details`` result to ``add``; titles
+    whose content changed are embedded in batches by a background task and
+    upserted into the table, which gets an IVF-PQ index once it is large
+    enough. ``similar`` only reads the table, it never scrapes.
+    """
+
+    def __init__(self, path: Optional[str] = None, enabled: Optional[bool] = None):
+        enabled = enabled if enabled is not None else env_bool("RECOMMEND", True)
+        if enabled and lancedb is None:
+            logging.info("lancedb is not installed, similar titles are disabled")
+        self.enabled = enabled and lancedb is not None
+        self.path = path or os.getenv("RECOMMEND_DB", os.path.join(".cache", "recommend.lance"))
+        self.dims = env_int("RECOMMEND_DIMS", 256)
+        self.batch_size = env_int("RECOMMEND_BATCH", 64)
+        self.flush_interval = env_float("RECOMMEND_FLUSH_SECONDS", 10.0)
+        self.index_min_rows = env_int("RECOMMEND_INDEX_MIN_ROWS", 1000)
+        self.nprobes = env_int("RECOMMEND_NPROBES", 10)
+
+        self._db = None
+        self._table = None
+        self._indexed_rows = 0
+        # Vectors are also kept here so a lookup does not first have to find the title's row
+        self._vectors: Dict[TitleKey, "np.ndarray"] = {}
+        self._hashes: Dict[TitleKey, str] = {}
+        self._pending: Dict[TitleKey, Dict[str, Any]] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def load(self):
+        """Open the table and read back the stored vectors (blocking, run it in a thread at startup)."""
+        if not self.enabled:
+            return
+        self._db = lancedb.connect(self.path)
+        try:
+            self._table = self._db.open_table(TABLE)
+        except ValueError:  # first start, created with the first batch
+            return
+        rows = self._table.to_arrow().select(["server", "kind", "id", "hash", "vector"]).to_pylist()
+        for row in rows:
+            key = (row["server"], row["kind"], row["id"])
+            self._vectors[key] = np.asarray(row["vector"], dtype=np.float32)
+            self._hashes[key] = row["hash"]
+        self._indexed_rows = len(rows) if self._table.list_indices() else 0
+        RECOMMEND_TITLES.set(len(self._vectors))
+        logging.info(f"Loaded {len(rows)} title vectors")
+
+    def add(self, server: str, kind: str, title_id: str, details: Dict[str, Any]):
+        """Queue a title for embedding unless its description, genres and authors are unchanged."""
+        if not self.enabled or not isinstance(details, dict) or not details.get("title"):
+            return
+        weights = features(details)
+        if not weights:
+            return
+        key = (server, kind, str(title_id))
+        content = hashlib.blake2b(repr(sorted(weights.items())).encode(), digest_size=16).hexdigest()
+        queued = self._pending.get(key)
+        if content == (queued["hash"] if queued else self._hashes.get(key)):
+            return
+        self._pending[key] = {
+            "server": server, "kind": kind, "id": str(title_id), "hash": content, "weights": weights,
+            "title": details["title"].strip(), "img": details.get("img") or details.get("image") or "",
+        }
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+
+    async def flush(self):
+        """Embed the queued titles and upsert them into the table. The queue is taken on the event
+        loop and written in a thread; when the write fails the titles are queued again, unless a
+        newer version of one was queued meanwhile."""
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            rows = await asyncio.to_thread(self._write, pending)
+        except BaseException:
+            for key, item in pending.items():
+                self._pending.setdefault(key, item)
+            raise
+        for key, row in zip(pending, rows):
+            self._vectors[key] = row["vector"]
+            self._hashes[key] = row["hash"]
+        RECOMMEND_EMBEDDED.inc(len(rows))
+        RECOMMEND_TITLES.set(len(self._vectors))
+        await asyncio.to_thread(self._maybe_index, len(self._vectors))
+
+    def _write(self, pending: Dict[TitleKey, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        rows = [{**{name: value for name, value in item.items() if name != "weights"},
+                 "key": "/".join(key), "vector": embed(item["weights"], self.dims)}
+                for key, item in pending.items()]
+        if self._table is None:
+            self._table = self._db.create_table(TABLE, data=rows)
+        else:
+            self._table.merge_insert("key").when_matched_update_all().when_not_matched_insert_all().execute(rows)
+        return rows
+
+    def _maybe_index(self, rows: int):
+        """Train the ANN index once the table is big enough and again when it doubled, in between
+        new rows are only added to the existing index (``optimize``), which is much cheaper."""
+        if rows < self.index_min_rows:
+            return
+        started = time.monotonic()
+        if rows < self._indexed_rows * 2:
+            self._table.optimize()
+            return
+        self._table.create_index(
+            "vector", replace=True,
+            config=IvfPq(distance_type="cosine", num_partitions=max(1, int(rows ** 0.5) // 4),
+                         num_sub_vectors=max(1, self.dims // 16)))
+        self._indexed_rows = rows
+        logging.info(f"Indexed {rows} title vectors in {time.monotonic() - started:.1f}s")
+
+    def _nearest(self, vector: "np.ndarray", where: str, limit: int, prefilter: bool) -> List[Dict[str, Any]]:
+        return (self._table.search(vector).distance_type("cosine").nprobes(self.nprobes)
+                .where(where, prefilter=prefilter).select(["id", "title", "img", "server"])
+                .limit(limit).to_list())
+
+    def similar(self, server: str, kind: str, title_id: str, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """Titles of the same server most like this one (blocking), None when it was never embedded."""
+        vector = self._vectors.get((server, kind, str(title_id))) if self.enabled else None
+        if vector is None or self._table is None:
+            RECOMMEND_QUERIES.labels("unknown").inc()
+            return None
+        started = time.monotonic()
+        where = f"server = '{server}' AND kind = '{kind}'"
+        # Filtering after the ANN search is a lot faster than before it, but other servers' titles
+        # take places: ask for more and only filter first when that still did not leave enough
+        rows = self._nearest(vector, where, limit * 2 + 1, prefilter=False)
+        if len(rows) <= limit:
+            rows = self._nearest(vector, where, limit + 1, prefilter=True)
+        results = [{"id": row["id"], "title": row["title"], "img": row["img"], "server": row["server"],
+                    "score": round(1 - row["_distance"], 4)}
+                   for row in rows if row["id"] != str(title_id)][:limit]
+        RECOMMEND_QUERIES.labels("hit").inc()
+        RECOMMEND_SECONDS.observe(time.monotonic() - started)
+        return results
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.warning(f"Embedding titles failed: {e}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.enabled and self._pending:
+            await self.flush()
@@ -0,0 +1,98 @@
+import os
+import logging
+from typing import Dict, List, Optional, Sequence, Type
+
+from .http_client import UpstreamClientPool, upstream_key
+from .ratelimit import UpstreamLimiter
+
+MANGA_METHODS = ("scrape", "get_manga_details", "get_chapter_details", "search_manga")
+ANIME_METHODS = ("get_popular", "get_details", "search", "get_watching_links")
+
+
+class ScraperEntry:
+    def __init__(self, name: str, scraper_class: Type, base_url: Optional[str], image_base_urls: List[str],
+                 scraper=None, reason: Optional[str] = None):
+        self.name = name
+        self.scraper_class = scraper_class
+        self.base_url = base_url
+        self.image_base_urls = image_base_urls
+        self.scraper = scraper
+        self.reason = reason
+
+    @property
+    def available(self) -> bool:
+        return self.scraper is not None
+
+
+def missing_methods(scraper_class: Type, methods: Sequence[str]) -> List[str]:
+    return [name for name in methods if not callable(getattr(scraper_class, name, None))]
+
+
+class ScraperRegistry:
+    """Long-lived scraper instances keyed by server name, built once at startup."""
+
+    def __init__(self, http: UpstreamClientPool, methods: Sequence[str], **resources):
+        self.http = http
+        self.methods = methods
+        # Shared objects (caches, ...) handed to every scraper instance
+        self.resources = resources
+        self._entries: Dict[str, ScraperEntry] = {}
+
+    def register(self, name: str, scraper_class: Type, image_base_urls: Sequence[Optional[str]],
+                 base_url: Optional[str] = None, limits: Optional[Dict] = None) -> ScraperEntry:
+        base_url = base_url or os.getenv(name)
+        image_base_urls = [url for url in image_base_urls if url]
+
+        for upstream in [base_url, *image_base_urls]:
+            self._configure(name, upstream)
+        # Rate and concurrency limits guard the site itself, image CDNs only get connection limits
+        self._limit(name, base_url, limits)
+
+        entry = ScraperEntry(name, scraper_class, base_url, image_base_urls)
+        missing = missing_methods(scraper_class, self.methods)
+        if missing:
+            entry.reason = f"{scraper_class.__name__} does not implement {', '.join(missing)}"
+        elif scraper_class.unavailable_reason():
+            entry.reason = scraper_class.unavailable_reason()
+        elif not base_url:
+            entry.reason = f"{name} base url is not configured"
+        else:
+            entry.scraper = scraper_class(base_url, self.http, server=name, **self.resources)
+            # Other hosts of the same site (e.g. an ajax api) get the server's limits, a limiter of their own each
+            for upstream in entry.scraper.upstream_urls():
+                self._configure(name, upstream)
+                self._limit(name, upstream, limits)
+
+        if entry.reason:
+            logging.warning(f"Scraper {name} unavailable: {entry.reason}")
+        self._entries[name] = entry
+        return entry
+
+    def _configure(self, name: str, upstream: Optional[str]):
+        max_connections = os.getenv(f"{name}_MAX_CONNECTIONS")
+        self.http.configure_upstream(upstream, max_connections=int(max_connections) if max_connections else None)
+
+    def _limit(self, name: str, upstream: Optional[str], limits: Optional[Dict]):
+        if upstream:
+            self.http.limit_upstream(upstream, UpstreamLimiter.from_config(
+                name, upstream_key(upstream), limits, self.http.connection_limit(upstream)))
+
+    @classmethod
+    def from_server_map(cls, server_map: Dict[str, Dict], http: UpstreamClientPool,
+                        methods: Sequence[str], **resources) -> "ScraperRegistry":
+        registry = cls(http, methods, **resources)
+        for name, config in server_map.items():
+            registry.register(name, config["scraper"], config.get("image_base_urls", []), limits=config.get("limits"))
+        return registry
+
+    def get(self, name: str) -> Optional[ScraperEntry]:
+        return self._entries.get(name)
+
+    def available(self) -> List[ScraperEntry]:
+        return [entry for entry in self._entries.values() if entry.available]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._entries
+
+    def __iter__(self):
+        return iter(self._entries.values())
@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+from collections import Counter as Tally, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from .federated import normalize_title
+from .http_client import env_bool, env_float, env_int
+
+SEARCH_INDEX_DOCUMENTS = Gauge("search_index_documents", "Titles in the local search index")
+SEARCH_INDEX_QUERIES = Counter("search_index_queries_total", "Local search index queries", ["result"])
+SEARCH_INDEX_SECONDS = Histogram(
+    "search_index_query_seconds", "Time to answer a query from the local search index",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+
+# Keys the scrapers use for the same thing
+ID_KEYS = ("id", "mangaId")
+ALT_NAME_KEYS = ("other_name", "alternative", "altTitles")
+AUTHOR_KEYS = ("authors", "author")
+GENRE_KEYS = ("genres", "genre")
+# Placeholder values of the scraper specs, not real data
+PLACEHOLDERS = ("No ID", "No title", "No author")
+
+# Matches in authors / genres count for less than in the title or alt names
+META_WEIGHT = 0.5
+
+DocKey = Tuple[str, str, str]
+
+
+def trigrams(text: str, prefix: bool = False) -> Set[str]:
+    """Trigrams of each word padded with spaces. With ``prefix`` the last word is not
+    closed, so a half typed query ("eter") matches the words it starts ("eternal")."""
+    words = normalize_title(text).split()
+    grams: Set[str] = set()
+    for position, word in enumerate(words):
+        padded = f"  {word}" if prefix and position == len(words) - 1 else f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def as_list(value: Any) -> List[str]:
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [part.strip() for part in value.split(",") if part.strip()]
+    return [str(part) for part in value if part]
+
+
+def first_value(item: Dict[str, Any], keys: Iterable[str]) -> Any:
+    for key in keys:
+        value = item.get(key)
+        if value and value not in PLACEHOLDERS:
+            return value
+    return None
+
+
+class SearchIndex:
+    """In-process trigram index over titles, alt names, authors and genres of scraped titles.
+
+    The scrapers feed every list, search and details result through ``add``.
+    Postings live in memory; documents are written to SQLite in the background
+    (``SEARCH_INDEX_DB``) and loaded back at startup.
+    """
+
+    def __init__(self, path: Optional[str] = None, enabled: Optional[bool] = None,
+                 min_score: Optional[float] = None, flush_interval: Optional[float] = None):
+        self.enabled = enabled if enabled is not None else env_bool("SEARCH_INDEX", True)
+        self.path = path or os.getenv("SEARCH_INDEX_DB", os.path.join(".cache", "search-index.sqlite"))
+        self.min_score = min_score if min_score is not None else env_float("SEARCH_INDEX_MIN_SCORE", 0.5)
+        self.page_size = env_int("SEARCH_INDEX_PAGE_SIZE", 20)
+        self.flush_interval = flush_interval if flush_interval is not None else env_float(
+            "SEARCH_INDEX_FLUSH_SECONDS", 5.0)
+
+        self._keys: Dict[DocKey, int] = {}
+        self._docs: List[Optional[Dict[str, Any]]] = []
+        self._doc_keys: List[DocKey] = []
+        self._normalized: List[str] = []
+        self._names: Dict[str, Set[int]] = defaultdict(set)
+        self._meta: Dict[str, Set[int]] = defaultdict(set)
+        self._dirty: Set[int] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        db = sqlite3.connect(self.path)
+        db.execute("""CREATE TABLE IF NOT EXISTS documents (
+            server TEXT NOT NULL, kind TEXT NOT NULL, id TEXT NOT NULL, doc TEXT NOT NULL,
+            PRIMARY KEY (server, kind, id))""")
+        return db
+
+    def load(self):
+        """Read the persisted documents (blocking, run it in a thread at startup)."""
+        if not self.enabled:
+            return
+        started = time.monotonic()
+        with self._connect() as db:
+            rows = db.execute("SELECT server, kind, id, doc FROM documents").fetchall()
+        for server, kind, title_id, doc in rows:
+            self._put((server, kind, title_id), json.loads(doc))
+        self._dirty.clear()
+        logging.info(f"Loaded {len(rows)} search index documents in {time.monotonic() - started:.2f}s")
+
+    def _put(self, key: DocKey, doc: Dict[str, Any]):
+        number = self._keys.get(key)
+        if number is None:
+            number = self._keys[key] = len(self._docs)
+            self._docs.append(None)
+            self._doc_keys.append(key)
+            self._normalized.append("")
+        else:
+            self._unindex(number)
+        self._docs[number] = doc
+        self._normalized[number] = normalize_title(doc["title"])
+        for gram in trigrams(" ".join([doc["title"], *doc["alt"]])):
+            self._names[gram].add(number)
+        for gram in trigrams(" ".join([*doc["authors"], *doc["genres"]])):
+            self._meta[gram].add(number)
+        self._dirty.add(number)
+        SEARCH_INDEX_DOCUMENTS.set(len(self._keys))
+
+    def _unindex(self, number: int):
+        doc = self._docs[number]
+        for gram in trigrams(" ".join([doc["title"], *doc["alt"]])):
+            self._names[gram].discard(number)
+        for gram in trigrams(" ".join([*doc["authors"], *doc["genres"]])):
+            self._meta[gram].discard(number)
+
+    def add(self, server: str, kind: str, items: List[Dict[str, Any]], title_id: Optional[str] = None):
+        """Index list / search cards, or one title's details when ``title_id`` is given."""
+        if not self.enabled:
+            return
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            item_id = title_id or first_value(item, ID_KEYS)
+            title = first_value(item, ("title",))
+            if not item_id or not title:
+                continue
+            key = (server, kind, str(item_id))
+            number = self._keys.get(key)
+            doc = dict(self._docs[number]) if number is not None else {
+                "title": "", "alt": [], "authors": [], "genres": [], "card": None}
+            updated = {
+                "title": title.strip(),
+                "alt": as_list(first_value(item, ALT_NAME_KEYS)) or doc["alt"],
+                "authors": as_list(first_value(item, AUTHOR_KEYS)) or doc["authors"],
+                "genres": as_list(first_value(item, GENRE_KEYS)) or doc["genres"],
+                # Details pages don't look like search results, keep the card seen in a list
+                "card": doc["card"] if title_id and doc["card"] else self._card(item, item_id),
+            }
+            if updated != doc:
+                self._put(key, updated)
+
+    @staticmethod
+    def _card(item: Dict[str, Any], item_id: str) -> Dict[str, Any]:
+        card = {key: value for key, value in item.items() if key != "chapters"}
+        # Search results use mangaId, lists id, answer with both
+        card.setdefault("id", item_id)
+        card.setdefault("mangaId", item_id)
+        return card
+
+    def search(self, query: str, kind: str, servers: Optional[Iterable[str]] = None, page: int = 1,
+               page_size: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """One page of matching cards (best first, each with its ``server``) and the total number of matches."""
+        started = time.monotonic()
+        grams = trigrams(query, prefix=True)
+        if not self.enabled or not grams:
+            return [], 0
+        servers = set(servers) if servers is not None else None
+        names, meta = Tally(), Tally()
+        for gram in grams:
+            names.update(self._names.get(gram, ()))
+            meta.update(self._meta.get(gram, ()))
+        normalized = normalize_title(query)
+        matches = []
+        for number in names.keys() | meta.keys():
+            server, doc_kind, _ = self._doc_keys[number]
+            if doc_kind != kind or (servers is not None and server not in servers):
+                continue
+            score = (names[number] + META_WEIGHT * meta[number]) / len(grams)
+            if normalized and normalized in self._normalized[number]:
+                score += 0.5
+            if score >= self.min_score:
+                matches.append((-score, self._normalized[number], server, number))
+        matches.sort()
+        page_size = page_size or self.page_size
+        offset = (max(page, 1) - 1) * page_size
+        results = [{**self._docs[number]["card"], "server": server}
+                   for _, _, server, number in matches[offset:offset + page_size]]
+        SEARCH_INDEX_QUERIES.labels("hit" if results else "miss").inc()
+        SEARCH_INDEX_SECONDS.observe(time.monotonic() - started)
+        return results, len(matches)
+
+    async def flush(self):
+        """Write changed documents to SQLite. Rows are taken on the event loop, which owns the
+        documents, and written in a thread; when the write fails they stay dirty for the next flush."""
+        dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        rows = [(*self._doc_keys[number], json.dumps(self._docs[number], default=str)) for number in dirty]
+        try:
+            await asyncio.to_thread(self._write, rows)
+        except BaseException:
+            self._dirty |= dirty
+            raise
+
+    def _write(self, rows: List[Tuple[str, str, str, str]]):
+        with self._connect() as db:
+            db.executemany("INSERT OR REPLACE INTO documents (server, kind, id, doc) VALUES (?, ?, ?, ?)", rows)
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.warning(f"Writing the search index failed: {e}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.enabled:
+            await self.flush()
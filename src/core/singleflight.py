@@ -0,0 +1,42 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from prometheus_client import Counter
+
+SINGLEFLIGHT_REQUESTS = Counter(
+    "upstream_singleflight_requests_total",
+    "Upstream fetches by single-flight role (leader did the fetch, follower shared it)",
+    ["kind", "role"])
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one in-flight upstream fetch.
+
+    The fetch runs in its own task so a leader whose client disconnects does
+    not cancel the result the followers are waiting on.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            SINGLEFLIGHT_REQUESTS.labels(self.kind, "leader").inc()
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+        else:
+            SINGLEFLIGHT_REQUESTS.labels(self.kind, "follower").inc()
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even when every waiter went away
+            task.exception()
+
+    def __len__(self):
+        return len(self._inflight)
@@ -0,0 +1,111 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple, Union
+
+from prometheus_client import Counter, Histogram
+
+from .http_client import env_int
+
+try:
+    import cv2
+    import numpy as np
+except ImportError:  # opencv is optional, image params are ignored without it
+    cv2 = None
+
+# format -> (file extension for imencode, quality flag name, content type)
+FORMATS = {
+    "webp": (".webp", "IMWRITE_WEBP_QUALITY", "image/webp"),
+    "avif": (".avif", "IMWRITE_AVIF_QUALITY", "image/avif"),
+    "jpeg": (".jpg", "IMWRITE_JPEG_QUALITY", "image/jpeg"),
+    "png": (".png", None, "image/png"),
+}
+CONTENT_TYPE_FORMATS = {content_type: name for name, (_, _, content_type) in FORMATS.items()}
+DEFAULT_QUALITY = env_int("TRANSCODE_DEFAULT_QUALITY", 80)
+
+TRANSCODE_SECONDS = Histogram("image_transcode_seconds", "Time spent transcoding an image variant", ["format"])
+TRANSCODE_BYTES = Counter("image_transcode_bytes_total", "Image bytes before and after transcoding", ["stage"])
+
+
+class TranscodeError(Exception):
+    pass
+
+
+class ImageVariant:
+    """Requested output of the image routes: max width, quality and format."""
+
+    def __init__(self, width: Optional[int] = None, quality: Optional[int] = None, format: Optional[str] = None):
+        self.width = width
+        self.quality = quality or DEFAULT_QUALITY
+        self.format = format
+
+    def resolve_format(self, content_type: Optional[str]) -> str:
+        # Without an explicit format keep the source format, so ?w= alone only resizes
+        return self.format or CONTENT_TYPE_FORMATS.get((content_type or "").split(";")[0], "jpeg")
+
+    def cache_key(self, key: str) -> str:
+        return f"{key}?w={self.width or ''}&q={self.quality}&format={self.format or 'source'}"
+
+
+def transcode_file(source: Union[str, bytes], width: Optional[int], format: str, quality: int) -> Tuple[bytes, int]:
+    """Runs in a worker process. source is a file path or the image itself. Returns the encoded image and the source size."""
+    if isinstance(source, bytes):
+        image = cv2.imdecode(np.frombuffer(source, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    else:
+        image = cv2.imread(source, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise TranscodeError("Cannot decode image" if isinstance(source, bytes) else f"Cannot decode {source}")
+    height, source_width = image.shape[:2]
+    if width and width < source_width:
+        image = cv2.resize(image, (width, max(1, round(height * width / source_width))),
+                           interpolation=cv2.INTER_AREA)
+    extension, quality_flag, _ = FORMATS[format]
+    params = [getattr(cv2, quality_flag), quality] if quality_flag and hasattr(cv2, quality_flag) else []
+    ok, encoded = cv2.imencode(extension, image, params)
+    if not ok:
+        raise TranscodeError(f"Cannot encode {format}")
+    return encoded.tobytes(), len(source) if isinstance(source, bytes) else os.path.getsize(source)
+
+
+class Transcoder:
+    """Process pool for resizing and re-encoding images off the event loop."""
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers if workers is not None else env_int(
+            "TRANSCODE_WORKERS", max(1, (os.cpu_count() or 2) // 2))
+        # Without the image cache sources are transcoded from memory, bigger ones are served as they are
+        self.max_source_bytes = env_int("TRANSCODE_MAX_SOURCE_BYTES", 32 * 1024 * 1024)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        if cv2 is None:
+            logging.warning("opencv is not installed, image transcoding is disabled")
+        elif self.workers > 0:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    @property
+    def available(self) -> bool:
+        return self._executor is not None
+
+    async def transcode(self, source: Union[str, bytes], variant: ImageVariant,
+                        headers: Dict[str, str]) -> Tuple[bytes, Dict[str, str]]:
+        format = variant.resolve_format(headers.get("content-type"))
+        loop = asyncio.get_running_loop()
+        with TRANSCODE_SECONDS.labels(format).time():
+            try:
+                data, source_size = await loop.run_in_executor(
+                    self._executor, transcode_file, source, variant.width, format, variant.quality)
+            except TranscodeError:
+                raise
+            except Exception as e:
+                raise TranscodeError(str(e)) from e
+        TRANSCODE_BYTES.labels("source").inc(source_size)
+        TRANSCODE_BYTES.labels("output").inc(len(data))
+        out_headers = {"content-type": FORMATS[format][2]}
+        if "cache-control" in headers:
+            out_headers["cache-control"] = headers["cache-control"]
+        return data, out_headers
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
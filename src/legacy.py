@@ -0,0 +1,328 @@
+"""Routes of the old express js api and the consumet style gogoanime api.
+
+Kept for existing clients, with the response shapes they know. Every route
+is served by AnitakuScraper, so they share the connection pool, HTML cache,
+coalescing, rate limits and parse executor with /api/anime.
+"""
+import os
+import json
+import logging
+from typing import Dict, List, Optional, Union
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from .core.ratelimit import UpstreamOverloaded, upstream_error
+from .scrapers.anime_scraper import AnitakuScraper
+
+router = APIRouter(tags=["legacy"])
+
+
+# Model Definitions
+class Anime(BaseModel):
+    title: str
+    id: str
+    image: str
+    episode_number: Union[str, None] = None
+
+class AnimeDetails(BaseModel):
+    title: str
+    image: str
+    type: str
+    summary: str
+    relased: str
+    genres: str
+    status: str
+    totalepisode: str
+    Othername: str
+
+class SearchResult(BaseModel):
+    title: str
+    id: str
+    image: str
+
+class WatchingLink(BaseModel):
+    src: str
+    size: str
+
+class AnimeListItem(BaseModel):
+    title: str
+    id: str
+
+class GenreList(BaseModel):
+    list: List[str]
+
+
+def anitaku(request: Request) -> AnitakuScraper:
+    entry = request.app.state.anime_registry.get("ANITAKU")
+    if entry is None or not entry.available:
+        raise HTTPException(status_code=501, detail=f"Server ANITAKU is not available: {entry.reason if entry else 'not configured'}")
+    return entry.scraper
+
+
+async def upstream(call):
+    try:
+        return await call
+    except Exception as e:
+        raise upstream_error(e)
+
+
+def positive_page(page: int):
+    if page < 1:
+        raise HTTPException(status_code=400, detail="Page must be a positive integer")
+
+
+def slug(href: str) -> str:
+    """Last path segment of a site link: /category/naruto -> naruto, /naruto-episode-5 -> naruto-episode-5."""
+    return href.rstrip('/').split('/')[-1]
+
+
+############################## express js api ##############################
+
+@router.get("/api/home")
+async def get_home():
+    host_url = os.getenv("HOST_URL", "http://localhost:8001")
+    info = {
+        "popular": {"recipe": f"{host_url}/api/popular/:page", "test": f"{host_url}/api/popular/2"},
+        "details": {"recipe": f"{host_url}/api/details/:id", "test": f"{host_url}/api/details/gintama"},
+        "search": {"recipe": f"{host_url}/api/search/:word/:page", "test": f"{host_url}/api/search/killer/1"},
+        "episode_link": {"recipe": f"{host_url}/api/watching/:id/:episode", "test": f"{host_url}/api/watching/gintama/50"},
+        "genre": {"recipe": f"{host_url}/api/genre/:type/:page", "test": f"{host_url}/api/genre/action/2"},
+        "recently_added": {"recipe": f"{host_url}/api/recentlyadded/:page", "test": f"{host_url}/api/recentlyadded/1"},
+        "anime_list": {"recipe": f"{host_url}/api/list/:variable/:page", "test": f"{host_url}/api/list/one/1"},
+        "genrelist": {"recipe": f"{host_url}/api/genrelist", "test": f"{host_url}/api/genrelist"}
+    }
+    return info
+
+@router.get("/api/docs")
+async def get_docs():
+    response = {
+        "message": "Welcome to AnimeVariant API!",
+        "api": {
+            "version": "1.0.0",
+            "author": "Valiantlynx",
+            "description": "An API for accessing anime information and resources.",
+            "endpoints": [
+                {"path": "/api/home", "description": "Get information about available API endpoints.", "params": {}},
+                {"path": "/api/popular/:page", "description": "Get a list of popular anime.", "params": {"page": "an integer representing the page number"}},
+                {"path": "/api/details/:id", "description": "Get details of a specific anime by ID.", "params": {"id": "The correct name of the anime"}},
+                {"path": "/api/search/:word/:page", "description": "Search for anime by a keyword.", "params": {"word": "The keyword to search for", "page": "an integer representing the page number"}},
+                {"path": "/api/watching/:id/:episode", "description": "Get the video links for a specific episode of an anime.", "params": {"id": "The correct name of the anime", "episode": "an integer representing the episode number"}},
+                {"path": "/api/genre/:type/:page", "description": "Get a list of anime by genre.", "params": {"type": "The genre of the anime", "page": "an integer representing the page number"}},
+                {"path": "/api/recentlyadded/:page", "description": "Get a list of recently added anime.", "params": {"page": "an integer representing the page number"}},
+                {"path": "/api/list/:variable/:page", "description": "Get a list of anime based on a variable.", "params": {"variable": "The variable to filter the list", "page": "an integer representing the page number"}},
+                {"path": "/api/genrelist", "description": "Get a list of available anime genres.", "params": {}}
+            ]
+        }
+    }
+    return response
+
+@router.get("/api/popular/{page}", response_model=Dict[str, List[Anime]])
+async def get_popular(page: int, scraper: AnitakuScraper = Depends(anitaku)):
+    positive_page(page)
+    return {"results": await upstream(scraper.get_popular(page))}
+
+@router.get("/api/details/{id}", response_model=Dict[str, List[AnimeDetails]])
+async def get_details(id: str, scraper: AnitakuScraper = Depends(anitaku)):
+    details = await upstream(scraper.get_details(id))
+    return {"results": [{
+        "title": details["title"],
+        "image": details["image"],
+        "type": details["type"],
+        "summary": details["summary"],
+        "relased": details["released"],
+        "genres": details["genres"],
+        "status": details["status"],
+        "totalepisode": details["total_episode"],
+        "Othername": details["other_name"]
+    }]}
+
+@router.get("/api/search/{word}/{page}", response_model=Dict[str, List[SearchResult]])
+async def search(word: str, page: int, scraper: AnitakuScraper = Depends(anitaku)):
+    positive_page(page)
+    return {"results": await upstream(scraper.search(word, page))}
+
+@router.get("/api/watching/{id}/{episode}")
+async def get_watching(id: str, episode: int, scraper: AnitakuScraper = Depends(anitaku)):
+    try:
+        watching = await scraper.get_watching_links(id, episode, labels=True)
+    except UpstreamOverloaded:
+        raise
+    except Exception as e:
+        # Missing episodes always answered with empty links
+        logging.warning(f"Watching links of {id} episode {episode} failed: {e}")
+        return {"links": [], "link": "", "totalepisode": ""}
+    links = [{"src": link["src"], "size": link["label"].replace("(", "").replace(")", "").replace(" - mp4", "")}
+             for link in watching["links"]]
+    return {"links": links, "link": watching["link"], "totalepisode": watching["total_episode"]}
+
+@router.get("/api/genre/{type}/{page}", response_model=Dict[str, List[Anime]])
+async def get_genre(type: str, page: int, scraper: AnitakuScraper = Depends(anitaku)):
+    positive_page(page)
+    return {"results": await upstream(scraper.get_genre(type, page))}
+
+@router.get("/api/recentlyadded/{page}", response_model=Dict[str, List[Anime]])
+async def get_recently_added(page: int, scraper: AnitakuScraper = Depends(anitaku)):
+    positive_page(page)
+    return {"results": await upstream(scraper.get_recently_added(page))}
+
+@router.get("/api/genrelist", response_model=GenreList)
+async def get_genre_list(scraper: AnitakuScraper = Depends(anitaku)):
+    return {"list": await upstream(scraper.get_genre_list())}
+
+@router.get("/api/list/{variable}/{page}", response_model=Dict[str, List[AnimeListItem]])
+async def get_list(variable: str, page: int, scraper: AnitakuScraper = Depends(anitaku)):
+    positive_page(page)
+    return {"list": await upstream(scraper.get_anime_list(variable, page))}
+
+
+############################## consumet style api ##############################
+
+def listing_card(scraper: AnitakuScraper, item: Dict[str, str]) -> Dict[str, str]:
+    return {
+        'id': slug(item['href']),
+        'title': item['title'],
+        'image': item['image'],
+        'releaseDate': item['released'],
+        'url': f"{scraper.base_url}{item['href']}",
+    }
+
+
+@router.get("/search/")
+async def search_filter(query: str, page: int = 1, scraper: AnitakuScraper = Depends(anitaku)):
+    listing = await upstream(scraper.get_listing("filter", page, keyword=query))
+    results = [{**listing_card(scraper, item), 'subOrDub': 'DUB' if '(dub)' in item['title'].lower() else 'SUB'}
+               for item in listing['items']]
+    return {"currentPage": page, "hasNextPage": listing['has_next_page'], "results": results}
+
+
+@router.get("/anime/{id}/")
+async def fetch_anime_info(id: str, page: Optional[int] = Query(default=None, ge=1),
+                           per_page: int = Query(default=100, ge=1, le=1000), stream: bool = False,
+                           scraper: AnitakuScraper = Depends(anitaku)):
+    """`page`/`per_page` return one page of the episodes (newest first) and only fetch the ranges it
+    covers; `stream=true` answers NDJSON: the info first, then one line per range of episodes."""
+    anime_id = slug(id)
+    details = await upstream(scraper.get_details(anime_id))
+    total = int(details['total_episode'] or 0)
+    info = {
+        'id': anime_id,
+        'title': details['title'],
+        'image': details['image'],
+        'releaseDate': details['released'],
+        'description': details['summary'],
+        'genres': [genre for genre in details['genres'].split(',') if genre],
+        'totalEpisodes': total,
+    }
+
+    def with_urls(episodes):
+        return [{**episode, 'url': f"{scraper.base_url}/{episode['id']}"} for episode in episodes]
+
+    if stream:
+        async def lines():
+            yield json.dumps(info) + "\n"
+            try:
+                async for start, end, episodes in scraper.iter_episode_chunks(details):
+                    yield json.dumps({'from': start + 1, 'to': end, 'episodes': with_urls(episodes)}) + "\n"
+            except Exception as e:
+                # Too late for an error status
+                logging.warning(f"Streaming the episodes of {anime_id} failed: {e}")
+                yield json.dumps({'error': str(e) or type(e).__name__}) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    if page is None:
+        return {**info, 'episodes': with_urls(await upstream(scraper.get_episode_list(details)))}
+    end = max(0, total - (page - 1) * per_page)
+    episodes = await upstream(scraper.get_episode_list(details, max(0, end - per_page), end)) if end else []
+    return {**info, 'page': page, 'perPage': per_page, 'hasNextPage': end - per_page > 0,
+            'episodes': with_urls(episodes)}
+
+
+@router.get("/episode/{episode_id}/sources/")
+async def fetch_episode_sources(episode_id: str, server: str = "GogoCDN", scraper: AnitakuScraper = Depends(anitaku)):
+    """Embed urls of the episode's video servers whose name contains `server` (all when none does)."""
+    links = await upstream(scraper.get_episode_links(slug(episode_id)))
+    sources = [link['url'] for link in links['servers'] if server.lower() in link['name'].lower()]
+    return {"sources": sources or [link['url'] for link in links['servers']], "download": links['download']}
+
+
+@router.get("/episode/{episode_id}/servers/")
+async def fetch_episode_servers(episode_id: str, scraper: AnitakuScraper = Depends(anitaku)):
+    links = await upstream(scraper.get_episode_links(slug(episode_id)))
+    return links['servers']
+
+
+@router.get("/recent/")
+async def fetch_recent_episodes(page: int = 1, type: int = 1, scraper: AnitakuScraper = Depends(anitaku)):
+    listing = await upstream(scraper.get_listing("recent", page, type=type))
+    results = [{
+        'id': slug(item['href']).split('-episode')[0],
+        'episodeId': slug(item['href']),
+        'episodeNumber': item['episode'],
+        'title': item['title'],
+        'image': item['image'],
+        'url': f"{scraper.base_url}{item['href']}",
+    } for item in listing['items']]
+    return {"currentPage": page, "hasNextPage": listing['has_next_page'], "results": results}
+
+
+@router.get("/genre/{genre}/")
+async def fetch_genre_info(genre: str, page: int = 1, scraper: AnitakuScraper = Depends(anitaku)):
+    listing = await upstream(scraper.get_listing("genre", page, genre=genre))
+    return {"currentPage": page, "hasNextPage": listing['has_next_page'],
+            "results": [listing_card(scraper, item) for item in listing['items']]}
+
+
+@router.get("/top-airing/")
+async def fetch_top_airing(page: int = 1, scraper: AnitakuScraper = Depends(anitaku)):
+    listing = await upstream(scraper.get_listing("top_airing", page))
+    results = [{
+        'id': slug(item['href']),
+        'title': item['title'],
+        'image': item['image'],
+        'episodeId': item['episode_id'],
+        'episodeNumber': item['episode'],
+    } for item in listing['items']]
+    return {"currentPage": page, "hasNextPage": listing['has_next_page'], "results": results}
+
+
+@router.get("/movies/recent/")
+async def fetch_recent_movies(page: int = 1, scraper: AnitakuScraper = Depends(anitaku)):
+    listing = await upstream(scraper.get_listing("recent", page, type=2))
+    return {"currentPage": page, "hasNextPage": listing['has_next_page'],
+            "results": [listing_card(scraper, item) for item in listing['items']]}
+
+
+@router.get("/episode/{episode_id}/anime-id/")
+async def fetch_anime_id_from_episode_id(episode_id: str, scraper: AnitakuScraper = Depends(anitaku)):
+    links = await upstream(scraper.get_episode_links(slug(episode_id)))
+    if not links['anime_id']:
+        raise HTTPException(status_code=404, detail=f"No anime link on {episode_id}")
+    return {"animeId": links['anime_id']}
+
+
+@router.get("/popular/")
+async def fetch_popular(page: int = 1, scraper: AnitakuScraper = Depends(anitaku)):
+    listing = await upstream(scraper.get_listing("popular", page))
+    return {"results": [listing_card(scraper, item) for item in listing['items']]}
+
+
+@router.get("/genres/")
+async def fetch_genre_list(scraper: AnitakuScraper = Depends(anitaku)):
+    genres = await upstream(scraper.get_genre_links())
+    return {"genres": [{'genre': genre['genre'], 'url': f"{scraper.base_url}{genre['href']}"} for genre in genres]}
+
+
+@router.get("/episode/{episode_id}/download/")
+async def fetch_direct_download_link(episode_id: str, scraper: AnitakuScraper = Depends(anitaku)):
+    links = await upstream(scraper.get_episode_links(slug(episode_id)))
+    return {"download": links['download']}
+
+
+@router.get("/anime-list/")
+async def fetch_anime_list(page: int = 1, scraper: AnitakuScraper = Depends(anitaku)):
+    links = await upstream(scraper.get_anime_list_links(page))
+    results = [{'id': link['href'].split('/')[2], 'title': link['title'], 'url': f"{scraper.base_url}{link['href']}"}
+               for link in links]
+    return {"currentPage": page, "results": results}
@@ -1,140 +1,523 @@
-import httpx
-from bs4 import BeautifulSoup
-from typing import List, Dict, Any
+import os
+import re
+import time
+import base64
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlsplit
+from ..core.parsing import PageParts, make_soup
+from ..core.http_client import env_int
+from ..core.cache import TtlMemo
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+from prometheus_client import Counter
 from .base_scraper import BaseScraper
 
+
+# Extraction functions run on the parse executor, see manga_scraper.py
+
+ANIME_CARDS_PARTS = PageParts(classes=["img"])
+
+
+def parse_anime_cards(html: str) -> List[Dict[str, str]]:
+    soup = make_soup(html, ANIME_CARDS_PARTS)
+    results = []
+    for img in soup.select('.img'):
+        title = img.find('a')['title']
+        href = img.find('a')['href']
+        id = href[10:]
+        image = img.find('img')['src']
+        results.append({'title': title, 'id': id, 'image': image})
+    return results
+
+
+ANIME_DETAILS_PARTS = PageParts(classes=["anime_info_body_bg", "type"], ids=["episode_page", "movie_id", "alias_anime"])
+
+
+def parse_anime_details(html: str) -> Dict[str, Any]:
+    soup = make_soup(html, ANIME_DETAILS_PARTS)
+    details = {
+        'title': soup.select_one('.anime_info_body_bg h1').text.strip(),
+        'image': soup.select_one('.anime_info_body_bg img')['src'],
+        'type': '',
+        'summary': '',
+        'released': '',
+        'status': '',
+        'genres': '',
+        'total_episode': '',
+        'other_name': '',
+        # What the ajax episode list is asked with
+        'movie_id': '',
+        'alias': ''
+    }
+    # Everything after the "Label: " span, fixed offsets broke whenever the markup around it changed
+    fields = {"Type:": 'type', "Plot Summary:": 'summary', "Released:": 'released', "Status:": 'status',
+              "Other name:": 'other_name'}
+    for p in soup.select('p.type'):
+        span = p.find('span')
+        if span is None:
+            continue
+        label = span.text.strip()
+        if label == "Genre:":
+            details['genres'] = ','.join(a.text.strip() for a in p.find_all('a'))
+        elif label in fields:
+            details[fields[label]] = p.text.strip()[len(label):].strip()
+
+    total_episode_elem = soup.select_one('#episode_page li:last-child a')
+    if total_episode_elem:
+        details['total_episode'] = total_episode_elem.get('ep_end', '')
+    for key, id in (('movie_id', 'movie_id'), ('alias', 'alias_anime')):
+        elem = soup.find('input', id=id)
+        if elem:
+            details[key] = elem.get('value', '')
+
+    return details
+
+
+EPISODE_PAGE_PARTS = PageParts(classes=["anime"], ids=["episode_page"])
+
+
+def parse_episode_page(html: str) -> Dict[str, str]:
+    soup = make_soup(html, EPISODE_PAGE_PARTS)
+    total_episode = ''
+    link = soup.select_one('li.anime a')['data-video'].replace("streaming.php", "download")
+    total_episode_elem = soup.select_one('#episode_page li:last-child a')
+    if total_episode_elem:
+        total_episode = total_episode_elem.text.split('-')[-1]
+    return {'link': link, 'total_episode': total_episode}
+
+
+DOWNLOAD_LINKS_PARTS = PageParts(attrs={"download": ""})
+
+
+def parse_download_links(html: str) -> List[Dict[str, str]]:
+    download_soup = make_soup(html, DOWNLOAD_LINKS_PARTS)
+    links = []
+    for a in download_soup.select('a[download=""]'):
+        size = a.text[21:].replace('(', '').replace(')', '').replace(' - mp4', '')
+        links.append({
+            'src': a['href'],
+            'size': 'High Speed' if size == 'HDP' else size,
+            # The whole link text, the legacy /api/watching route builds its size from it
+            'label': a.text.strip(),
+        })
+    return links
+
+
+# The episode label is the card's next sibling, keeping both keeps them adjacent
+RECENTLY_ADDED_PARTS = PageParts(classes=["img", "episode"])
+
+
+def parse_recently_added(html: str) -> List[Dict[str, str]]:
+    soup = make_soup(html, RECENTLY_ADDED_PARTS)
+    results = []
+    for img in soup.select('.img'):
+        title = img.find('a')['title']
+        href = img.find('a')['href']
+        image = img.find('img')['src']
+        episode_number = img.find_next_sibling('p', class_='episode').text.strip().replace(" ", "-").lower()
+        id = href[1:].replace(f"-{episode_number}", "")
+        episode_number = episode_number.replace("episode-", "")
+        results.append({'title': title, 'id': id, 'image': image, 'episode_number': episode_number})
+    return results
+
+
+GENRE_LIST_PARTS = PageParts(classes=["genre"])
+
+
+def parse_genre_list(html: str) -> List[str]:
+    soup = make_soup(html, GENRE_LIST_PARTS)
+    return [li.text for li in soup.select('nav.genre ul li')]
+
+
+ANIME_LIST_PARTS = PageParts(classes=["listing"])
+
+
+def parse_anime_list(html: str) -> List[Dict[str, str]]:
+    soup = make_soup(html, ANIME_LIST_PARTS)
+    results = []
+    for li in soup.select('ul.listing li'):
+        title = li.find('a').text
+        href = li.find('a')['href']
+        id = href[10:]
+        results.append({'title': title, 'id': id})
+    return results
+
+
+# Pages of the newer gogoanime layout, read by the legacy routes in legacy.py
+
+LISTING_PARTS = PageParts(classes=["last_episodes", "pagination-list"])
+
+
+def has_next_page(soup) -> bool:
+    selected = soup.select_one('.pagination-list li.selected')
+    return bool(selected and selected.find_next_sibling('li'))
+
+
+def parse_listing(html: str) -> Dict[str, Any]:
+    """Cards of the filter search, genre, popular and recent release pages and whether a next page exists."""
+    soup = make_soup(html, LISTING_PARTS)
+    items = []
+    for li in soup.select('.last_episodes > ul > li'):
+        link = li.select_one('p.name a')
+        if link is None:
+            continue
+        image = li.select_one('.img img')
+        released = li.select_one('p.released')
+        episode = li.select_one('p.episode')
+        items.append({
+            'href': link['href'].strip(),
+            'title': link.text.strip(),
+            'image': image['src'] if image else '',
+            'released': released.text.strip().replace('Released: ', '') if released else '',
+            'episode': episode.text.strip().replace('Episode ', '') if episode else '',
+        })
+    return {'items': items, 'has_next_page': has_next_page(soup)}
+
+
+TOP_AIRING_PARTS = PageParts(classes=["added_series_body", "pagination-list"])
+BACKGROUND_IMAGE = re.compile(r"https?://[^'\")]+?\.(?:png|jpe?g|webp)")
+
+
+def parse_top_airing(html: str) -> Dict[str, Any]:
+    soup = make_soup(html, TOP_AIRING_PARTS)
+    items = []
+    for li in soup.select('.added_series_body.popular > ul > li'):
+        links = li.find_all('a', recursive=False)
+        if len(links) < 2:
+            continue
+        cover = links[0].find('div')
+        image = BACKGROUND_IMAGE.search(cover.get('style', '')) if cover else None
+        paragraphs = li.find_all('p', recursive=False)
+        latest = paragraphs[1].find('a') if len(paragraphs) > 1 else None
+        items.append({
+            'href': links[0]['href'].strip(),
+            'title': links[1].text.split(',')[0].strip(),
+            'image': image.group(0) if image else '',
+            'episode_id': latest.get('title', '') if latest else '',
+            'episode': latest.text.strip().replace('Episode ', '') if latest else '',
+        })
+    return {'items': items, 'has_next_page': has_next_page(soup)}
+
+
+EPISODE_LINKS_PARTS = PageParts(classes=["anime_muti_link", "dowloads", "anime-info"])
+
+
+def parse_episode_links(html: str) -> Dict[str, Any]:
+    """Video servers, the download page and the anime of an episode page."""
+    soup = make_soup(html, EPISODE_LINKS_PARTS)
+    servers = []
+    for a in soup.select('.anime_muti_link li a[data-video]'):
+        url = a['data-video']
+        servers.append({
+            # The link also holds a "Choose this server" span
+            'name': (a.find(string=True, recursive=False) or '').strip(),
+            'url': url if url.startswith('http') else f"https:{url}",
+        })
+    download = soup.select_one('.dowloads a')
+    anime = soup.select_one('.anime-info a[href], .anime_muti_link > a[href]')
+    return {
+        'servers': servers,
+        'download': download['href'] if download else '',
+        'anime_id': anime['href'].rstrip('/').split('/')[-1] if anime else '',
+    }
+
+
+EPISODE_LIST_PARTS = PageParts(ids=["episode_related"])
+
+
+def parse_episode_list(html: str) -> List[Dict[str, str]]:
+    soup = make_soup(html, EPISODE_LIST_PARTS)
+    episodes = []
+    for li in soup.select('#episode_related > li'):
+        link = li.find('a')
+        name = li.select_one('div.name')
+        if link is None:
+            continue
+        episodes.append({
+            'id': link['href'].strip().lstrip('/'),
+            'number': name.text.strip().replace('EP ', '') if name else '',
+        })
+    return episodes
+
+
+GENRE_LINKS_PARTS = PageParts(classes=["menu_series"])
+
+
+def parse_genre_links(html: str) -> List[Dict[str, str]]:
+    soup = make_soup(html, GENRE_LINKS_PARTS)
+    return [{'genre': a.text.strip(), 'href': a['href']} for a in soup.select('.menu_series.genre > ul > li > a')]
+
+
+ANIME_LIST_LINKS_PARTS = PageParts(classes=["anime_list_body"])
+
+
+def parse_anime_list_links(html: str) -> List[Dict[str, str]]:
+    soup = make_soup(html, ANIME_LIST_LINKS_PARTS)
+    links = []
+    for li in soup.select('div.anime_list_body > ul > li'):
+        a = li.find('a')
+        links.append({'title': a.text.strip(), 'href': a['href']})
+    return links
+
+
+# Query parameters signed video urls keep their expiry in, as a unix timestamp
+EXPIRY_PARAMS = ("expires", "expire", "expiry", "exp", "e", "deadline", "valid_to")
+
+
+def url_expiry(url: str, unwrap: bool = True) -> Optional[float]:
+    """Unix time a signed url stops working, None when the url does not say."""
+    params = {name.lower(): values[0] for name, values in parse_qs(urlsplit(url).query).items() if values}
+    if "x-amz-expires" in params and "x-amz-date" in params:
+        try:
+            signed_at = datetime.strptime(params["x-amz-date"], "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+            return signed_at.timestamp() + int(params["x-amz-expires"])
+        except ValueError:
+            pass
+    for name in EXPIRY_PARAMS:
+        value = params.get(name, "")
+        if value.isdigit():
+            stamp = int(value) / 1000 if len(value) > 12 else int(value)
+            # Short names like "e" are only an expiry when they look like a timestamp
+            if stamp > 1e9:
+                return stamp
+    # Download redirectors (download.php?url=<base64>) wrap the signed url
+    wrapped = params.get("url")
+    if wrapped and unwrap:
+        try:
+            inner = base64.urlsafe_b64decode(wrapped + "=" * (-len(wrapped) % 4)).decode()
+        except (ValueError, UnicodeDecodeError):
+            inner = wrapped
+        if inner.startswith("http"):
+            return url_expiry(inner, unwrap=False)
+    return None
+
+
+def signed_ttl(urls: List[str], margin: float) -> Optional[float]:
+    """Seconds until the first of ``urls`` expires less ``margin``, None when none of them is signed."""
+    expiries = [expiry for expiry in map(url_expiry, urls) if expiry is not None]
+    if not expiries:
+        return None
+    return min(expiries) - time.time() - margin
+
+
+EPISODE_CHUNKS = Counter("anime_episode_chunks_total", "Episode list chunks served from the per anime cache or fetched",
+                         ["result"])
+
+
+class EpisodeChunk:
+    __slots__ = ("end", "fetched_at", "episodes")
+
+    def __init__(self, end: int, fetched_at: float, episodes: List[Dict[str, str]]):
+        self.end = end
+        self.fetched_at = fetched_at
+        self.episodes = episodes
+
+
+def episode_ranges(total: int, size: int, start: int = 0, end: Optional[int] = None) -> List[Tuple[int, int]]:
+    """The ``ep_start``/``ep_end`` ranges, aligned to ``size``, that cover episodes ``start``..``end``."""
+    end = total if end is None else min(end, total)
+    first = max(0, start) // size * size
+    return [(chunk, min(chunk + size, total)) for chunk in range(first, end, size)]
+
+
+def episode_number(episode: Dict[str, str]) -> Optional[float]:
+    try:
+        return float(episode['number'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
 class AnitakuScraper(BaseScraper):
-    async def fetch_html(self, url: str) -> str:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            return response.text
+    content_kind = "anime"
+
+    # Listing pages of the newer layout, see parse_listing
+    LISTING_URLS = {
+        "filter": "{base_url}/filter.html?keyword={keyword}&page={page}",
+        "popular": "{base_url}/popular.html?page={page}",
+        "genre": "{base_url}/genre/{genre}?page={page}",
+        "recent": "{ajax_url}/page-recent-release.html?page={page}&type={type}",
+        "top_airing": "{ajax_url}/page-recent-release-ongoing.html?page={page}",
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Episode lists and recent releases are served by gogoanime's ajax host
+        self.ajax_url = os.getenv("ANITAKU_AJAX", "https://ajax.gogocdn.net/ajax")
+        self.episode_chunk_size = max(1, env_int("ANITAKU_EPISODE_CHUNK", 100))
+        self.episode_concurrency = max(1, env_int("ANITAKU_EPISODE_CONCURRENCY", 4))
+        self.episode_ttl = env_int("ANITAKU_EPISODE_TTL", 21600)
+        self.episode_cache_size = env_int("ANITAKU_EPISODE_CACHE", 512)
+        # anime -> chunk start -> chunk, least recently used first
+        self.episode_chunks: "OrderedDict[str, Dict[int, EpisodeChunk]]" = OrderedDict()
+        # Watching links: episode page -> its download page, download page -> the video sources.
+        # Both keep an entry no longer than its signed urls stay valid.
+        self.episode_pages = TtlMemo("anitaku_episode_page", ttl=env_int("ANITAKU_EPISODE_PAGE_TTL", 3600))
+        self.download_pages = TtlMemo("anitaku_download_page", ttl=env_int("ANITAKU_SOURCES_TTL", 1800))
+        self.signed_url_margin = env_int("ANITAKU_SIGNED_URL_MARGIN", 120)
+        self.watching_concurrency = max(1, env_int("ANITAKU_WATCHING_CONCURRENCY", 4))
+
+    def upstream_urls(self) -> List[str]:
+        # The episode list fan-out goes to the ajax host, it needs the same rate limit as the site
+        return [self.ajax_url]
 
     async def get_popular(self, page: int) -> List[Dict[str, str]]:
         url = f"{self.base_url}/popular.html?page={page}"
-        html = await self.fetch_html(url)
-        soup = BeautifulSoup(html, 'html.parser')
-        results = []
-        for img in soup.select('.img'):
-            title = img.find('a')['title']
-            href = img.find('a')['href']
-            id = href[10:]
-            image = img.find('img')['src']
-            results.append({'title': title, 'id': id, 'image': image})
-        return results
+        html = await self.fetch_html(url, route="list")
+        return self.index_titles(await self.parse(parse_anime_cards, html))
 
     async def get_details(self, anime_id: str) -> Dict[str, Any]:
         url = f"{self.base_url}/category/{anime_id}"
-        html = await self.fetch_html(url)
-        soup = BeautifulSoup(html, 'html.parser')
-        details = {
-            'title': soup.select_one('.anime_info_body_bg h1').text.strip(),
-            'image': soup.select_one('.anime_info_body_bg img')['src'],
-            'type': '',
-            'summary': '',
-            'released': '',
-            'status': '',
-            'genres': '',
-            'total_episode': '',
-            'other_name': ''
-        }
-        for p in soup.select('p.type'):
-            span_text = p.find('span').text
-            if span_text == "Type: ":
-                details['type'] = p.text[15:-5].strip()
-            elif span_text == "Plot Summary: ":
-                details['summary'] = p.text[14:].strip()
-            elif span_text == "Released: ":
-                details['released'] = p.text[10:].strip()
-            elif span_text == "Status: ":
-                details['status'] = p.text[8:].strip()
-            elif span_text == "Genre: ":
-                details['genres'] = p.text[20:-4].strip().replace(' ', ',')
-            elif span_text == "Other name: ":
-                details['other_name'] = p.text[12:].strip()
-
-        total_episode_elem = soup.select_one('#episode_page li:last-child a')
-        if total_episode_elem:
-            details['total_episode'] = total_episode_elem.get('ep_end', '')
-
-        return details
+        html = await self.fetch_html(url, route="details")
+        return self.index_titles(await self.parse(parse_anime_details, html), anime_id)
 
     async def search(self, keyword: str, page: int) -> List[Dict[str, str]]:
         url = f"{self.base_url}/search.html?keyword={keyword}&page={page}"
-        html = await self.fetch_html(url)
-        soup = BeautifulSoup(html, 'html.parser')
-        results = []
-        for img in soup.select('.img'):
-            title = img.find('a')['title']
-            href = img.find('a')['href']
-            id = href[10:]
-            image = img.find('img')['src']
-            results.append({'title': title, 'id': id, 'image': image})
-        return results
-
-    async def get_watching_links(self, anime_id: str, episode: int) -> Dict[str, Any]:
-        url = f"{self.base_url}/{anime_id}-episode-{episode}"
-        html = await self.fetch_html(url)
-        soup = BeautifulSoup(html, 'html.parser')
-        links = []
-        total_episode = ''
-        link = soup.select_one('li.anime a')['data-video'].replace("streaming.php", "download")
-        total_episode_elem = soup.select_one('#episode_page li:last-child a')
-        if total_episode_elem:
-            total_episode = total_episode_elem.text.split('-')[-1]
-
-        download_html = await self.fetch_html(link)
-        download_soup = BeautifulSoup(download_html, 'html.parser')
-        for a in download_soup.select('a[download=""]'):
-            size = a.text[21:].replace('(', '').replace(')', '').replace(' - mp4', '')
-            links.append({
-                'src': a['href'],
-                'size': 'High Speed' if size == 'HDP' else size
-            })
-        return {'links': links, 'link': link, 'total_episode': total_episode}
+        html = await self.fetch_html(url, route="search")
+        return self.index_titles(await self.parse(parse_anime_cards, html))
+
+    async def _fetch_episode_page(self, anime_id: str, episode: int) -> Dict[str, str]:
+        html = await self.fetch_html(f"{self.base_url}/{anime_id}-episode-{episode}")
+        return await self.parse(parse_episode_page, html)
+
+    async def _fetch_download_page(self, link: str) -> List[Dict[str, str]]:
+        html = await self.fetch_html(link)
+        return await self.parse(parse_download_links, html)
+
+    async def get_watching_links(self, anime_id: str, episode: int, labels: bool = False) -> Dict[str, Any]:
+        """Download links of an episode, with each link's text as ``label`` when ``labels`` is set."""
+        episode_page = await self.episode_pages.get_or_call(
+            (anime_id, episode), lambda: self._fetch_episode_page(anime_id, episode),
+            ttl_for=lambda page: signed_ttl([page['link']], self.signed_url_margin))
+        link = episode_page['link']
+        # An empty list is more likely a broken page than an episode without sources, not kept
+        links = await self.download_pages.get_or_call(
+            link, lambda: self._fetch_download_page(link),
+            ttl_for=lambda links: signed_ttl([l['src'] for l in links], self.signed_url_margin) if links else 0)
+        if not labels:
+            links = [{name: value for name, value in l.items() if name != 'label'} for l in links]
+        return {'links': links, 'link': link, 'total_episode': episode_page['total_episode']}
+
+    async def get_watching_links_range(self, anime_id: str, first: int, last: int) -> Dict[int, Any]:
+        """get_watching_links of episodes ``first``..``last``, ``ANITAKU_WATCHING_CONCURRENCY`` at a time.
+        A failed episode has its exception as the value."""
+        semaphore = asyncio.Semaphore(self.watching_concurrency)
+
+        async def resolve(episode: int):
+            async with semaphore:
+                return await self.get_watching_links(anime_id, episode)
+
+        episodes = range(first, last + 1)
+        results = await asyncio.gather(*(resolve(episode) for episode in episodes), return_exceptions=True)
+        return dict(zip(episodes, results))
 
     async def get_genre(self, genre: str, page: int) -> List[Dict[str, str]]:
         url = f"{self.base_url}/genre/{genre}?page={page}"
-        html = await self.fetch_html(url)
-        soup = BeautifulSoup(html, 'html.parser')
-        results = []
-        for img in soup.select('.img'):
-            title = img.find('a')['title']
-            href = img.find('a')['href']
-            id = href[10:]
-            image = img.find('img')['src']
-            results.append({'title': title, 'id': id, 'image': image})
-        return results
+        html = await self.fetch_html(url, route="list")
+        return self.index_titles(await self.parse(parse_anime_cards, html))
 
     async def get_recently_added(self, page: int) -> List[Dict[str, str]]:
         url = f"{self.base_url}/?page={page}"
-        html = await self.fetch_html(url)
-        soup = BeautifulSoup(html, 'html.parser')
-        results = []
-        for img in soup.select('.img'):
-            title = img.find('a')['title']
-            href = img.find('a')['href']
-            image = img.find('img')['src']
-            episode_number = img.find_next_sibling('p', class_='episode').text.strip().replace(" ", "-").lower()
-            id = href[1:].replace(f"-{episode_number}", "")
-            episode_number = episode_number.replace("episode-", "")
-            results.append({'title': title, 'id': id, 'image': image, 'episode_number': episode_number})
-        return results
+        html = await self.fetch_html(url, route="list")
+        return self.index_titles(await self.parse(parse_recently_added, html))
 
     async def get_genre_list(self) -> List[str]:
         url = self.base_url
-        html = await self.fetch_html(url)
-        soup = BeautifulSoup(html, 'html.parser')
-        return [li.text for li in soup.select('nav.genre ul li')]
+        html = await self.fetch_html(url, route="list")
+        return await self.parse(parse_genre_list, html)
 
     async def get_anime_list(self, variable: str, page: int) -> List[Dict[str, str]]:
         url = f"{self.base_url}/anime-list.html?page={page}" if variable == "all" else f"{self.base_url}/anime-list-{variable}?page={page}"
+        html = await self.fetch_html(url, route="list")
+        return self.index_titles(await self.parse(parse_anime_list, html))
+
+    async def get_listing(self, kind: str, page: int, **params) -> Dict[str, Any]:
+        """Cards of one of LISTING_URLS (``{'items', 'has_next_page'}``), through the HTML cache."""
+        url = self.LISTING_URLS[kind].format(base_url=self.base_url, ajax_url=self.ajax_url, page=page, **params)
+        html = await self.fetch_html(url, route="search" if kind == "filter" else "list")
+        return await self.parse(parse_top_airing if kind == "top_airing" else parse_listing, html)
+
+    def _episode_chunk_cache(self, details: Dict[str, Any]) -> Dict[int, EpisodeChunk]:
+        key = details['movie_id'] or details['alias'] or details['title']
+        chunks = self.episode_chunks.get(key)
+        if chunks is None:
+            chunks = self.episode_chunks[key] = {}
+            if len(self.episode_chunks) > self.episode_cache_size:
+                self.episode_chunks.popitem(last=False)
+        self.episode_chunks.move_to_end(key)
+        return chunks
+
+    async def _fetch_episode_chunk(self, details: Dict[str, Any], start: int, end: int) -> List[Dict[str, str]]:
+        url = (f"{self.ajax_url}/load-list-episode?ep_start={start}&ep_end={end}"
+               f"&id={details['movie_id']}&default_ep=0&alias={details['alias']}")
         html = await self.fetch_html(url)
-        soup = BeautifulSoup(html, 'html.parser')
-        results = []
-        for li in soup.select('ul.listing li'):
-            title = li.find('a').text
-            href = li.find('a')['href']
-            id = href[10:]
-            results.append({'title': title, 'id': id})
-        return results
+        return await self.parse(parse_episode_list, html)
+
+    async def iter_episode_chunks(self, details: Dict[str, Any], start: int = 0,
+                                  end: Optional[int] = None) -> AsyncIterator[Tuple[int, int, List[Dict[str, str]]]]:
+        """``(start, end, episodes)`` of the chunks covering episodes ``start``..``end``, newest first.
+
+        Missing chunks are fetched concurrently (``ANITAKU_EPISODE_CONCURRENCY``) and parsed one
+        by one as they arrive; each is yielded as soon as it and the newer ones are ready. Chunks
+        are cached per anime, when the episode count grows only the tail chunks are fetched again.
+        """
+        total = int(details['total_episode'] or 0)
+        ranges = episode_ranges(total, self.episode_chunk_size, start, total if end is None else end)
+        chunks = self._episode_chunk_cache(details)
+        now = time.monotonic()
+        semaphore = asyncio.Semaphore(self.episode_concurrency)
+
+        async def fetch(chunk_start: int, chunk_end: int):
+            async with semaphore:
+                return await self._fetch_episode_chunk(details, chunk_start, chunk_end)
+
+        tasks = {}
+        for chunk_start, chunk_end in ranges:
+            cached = chunks.get(chunk_start)
+            # A chunk ending somewhere else was the tail of a shorter list
+            if cached is not None and cached.end == chunk_end and now - cached.fetched_at < self.episode_ttl:
+                EPISODE_CHUNKS.labels("hit").inc()
+            else:
+                EPISODE_CHUNKS.labels("miss").inc()
+                tasks[chunk_start] = asyncio.ensure_future(fetch(chunk_start, chunk_end))
+        try:
+            for chunk_start, chunk_end in reversed(ranges):
+                if chunk_start in tasks:
+                    chunks[chunk_start] = EpisodeChunk(chunk_end, time.monotonic(), await tasks[chunk_start])
+                yield chunk_start, chunk_end, chunks[chunk_start].episodes
+        finally:
+            # The caller stopped early (client went away) or a chunk failed
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()
+
+    async def get_episode_list(self, details: Dict[str, Any], start: int = 0,
+                               end: Optional[int] = None) -> List[Dict[str, str]]:
+        """Episodes numbered ``start`` (exclusive) to ``end`` (all by default) of an anime, newest first,
+        like the upstream's ``ep_start``/``ep_end``: episode 0 belongs to the first range and a series
+        with gaps or .5 specials gets as many episodes as it has in the range. ``details`` is what
+        get_details returned for it."""
+        episodes: List[Dict[str, str]] = []
+        async for _, chunk_end, chunk in self.iter_episode_chunks(details, start, end):
+            for episode in chunk:
+                number = episode_number(episode)
+                # Unnumbered ones (specials) stay with the range their chunk ends in
+                number = chunk_end if number is None else number
+                if (start == 0 or number > start) and (end is None or number <= end):
+                    episodes.append(episode)
+        return episodes
+
+    async def get_episode_links(self, episode_id: str) -> Dict[str, Any]:
+        url = f"{self.base_url}/{episode_id}"
+        html = await self.fetch_html(url, route="chapter")
+        return await self.parse(parse_episode_links, html)
+
+    async def get_genre_links(self) -> List[Dict[str, str]]:
+        html = await self.fetch_html(self.base_url, route="list")
+        return await self.parse(parse_genre_links, html)
+
+    async def get_anime_list_links(self, page: int) -> List[Dict[str, str]]:
+        html = await self.fetch_html(f"{self.base_url}/anime-list.html?page={page}", route="list")
+        return await self.parse(parse_anime_list_links, html)
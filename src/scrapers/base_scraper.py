@@ -1,13 +1,72 @@
-import httpx
-from bs4 import BeautifulSoup
+import logging
+from typing import Any, Callable, List, Optional
 from abc import ABC, abstractmethod
+from ..core.http_client import UpstreamClientPool
+from ..core.cache import HtmlCache, TtlMemo
+from ..core.singleflight import SingleFlight
+from ..core.parsing import ParseExecutor
+from ..core.search_index import SearchIndex
+from ..core.recommend import Recommender
 
 class BaseScraper(ABC):
-    def __init__(self, base_url: str):
+    # Some upstreams (mangaclash) answer with 301s to canonical urls
+    follow_redirects = False
+    # What the titles are, for the search index
+    content_kind = "manga"
+
+    def __init__(self, base_url: str, http: Optional[UpstreamClientPool] = None, cache: Optional[HtmlCache] = None,
+                 inflight: Optional[SingleFlight] = None, details_memo: Optional[TtlMemo] = None,
+                 parser: Optional[ParseExecutor] = None, index: Optional[SearchIndex] = None,
+                 server: Optional[str] = None, recommender: Optional[Recommender] = None):
         self.base_url = base_url
+        self.server = server
+        self.http = http if http is not None else UpstreamClientPool()
+        self.cache = cache
+        self.inflight = inflight if inflight is not None else SingleFlight("html")
+        self.details_memo = details_memo if details_memo is not None else TtlMemo("manga_details")
+        self.parser = parser if parser is not None else ParseExecutor("inline")
+        self.index = index
+        self.recommender = recommender
+
+    @classmethod
+    def unavailable_reason(cls) -> Optional[str]:
+        """Why the scraper must not be used although it implements every method, None when it can be."""
+        return None
+
+    def upstream_urls(self) -> List[str]:
+        """Hosts other than base_url this scraper sends requests to, limited like the site itself."""
+        return []
+
+    async def fetch_html(self, url: str, route: Optional[str] = None):
+        """Fetch a page, going through the HTML cache when a route family is given."""
+        if self.cache is not None and route:
+            return await self.cache.get_or_fetch(url, lambda: self._fetch_upstream(url), route)
+        return await self._fetch_upstream(url)
+
+    async def parse(self, fn: Callable[..., Any], *args) -> Any:
+        """Run a module level extraction function (html in, plain data out) on the parse executor."""
+        return await self.parser.run(fn, *args)
+
+    def index_titles(self, items, title_id: Optional[str] = None):
+        """Feed list / search cards (or one title's details) to the search index, details also to the recommender."""
+        if self.index is not None and self.server:
+            self.index.add(self.server, self.content_kind, items if isinstance(items, list) else [items], title_id)
+        if self.recommender is not None and self.server and title_id:
+            self.recommender.add(self.server, self.content_kind, title_id, items)
+        return items
+
+    async def get_manga_details_cached(self, manga_id: str):
+        """get_manga_details memoized per manga for a short ttl, used when embedding it in chapter reads."""
+        return await self.details_memo.get_or_call(
+            (self.base_url, manga_id), lambda: self.get_manga_details(manga_id))
+
+    async def _fetch_upstream(self, url: str):
+        # Concurrent misses for the same page share one upstream request
+        return await self.inflight.do(url, lambda: self._get(url))
 
-    async def fetch_html(self, url: str):
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            return response.text
+    async def _get(self, url: str):
+        response = await self.http.get(url, follow_redirects=self.follow_redirects)
+        if response.history:
+            logging.warning(f"Redirected to {response.url}")
+        response.raise_for_status()
+        return response.text
@@ -0,0 +1,122 @@
+import os
+import json
+import asyncio
+import logging
+from functools import lru_cache
+from typing import Any, Dict, Optional, Type
+
+from .base_scraper import BaseScraper
+from ..core.extraction import PagePlan
+
+SPECS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "specs")
+
+
+def merge_specs(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict) and key != "fields":
+            merged[key] = merge_specs(base[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+@lru_cache(maxsize=None)
+def site_specs() -> Dict[str, Dict[str, Any]]:
+    """Site specs by name from the bundled specs dir and SCRAPER_SPECS_DIR, with ``extends`` resolved."""
+    raw: Dict[str, Dict[str, Any]] = {}
+    for directory in (SPECS_DIR, os.getenv("SCRAPER_SPECS_DIR")):
+        if not directory or not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".json"):
+                with open(os.path.join(directory, filename)) as f:
+                    raw[filename[:-len(".json")]] = json.load(f)
+
+    def resolve(name: str, seen=()) -> Dict[str, Any]:
+        if name in seen:
+            raise ValueError(f"Spec {name} extends itself")
+        spec = raw[name]
+        if "extends" in spec:
+            # Only the spec itself decides whether it is a usable site or just a base for others
+            spec = {**merge_specs(resolve(spec["extends"], (*seen, name)), spec), "abstract": spec.get("abstract", False)}
+        return spec
+
+    return {name: resolve(name) for name in raw}
+
+
+@lru_cache(maxsize=None)
+def site_plans(site: str) -> Dict[str, PagePlan]:
+    """Compile a site's page specs once per process (selectors, transforms, page parts)."""
+    spec = site_specs()[site]
+    return {page: PagePlan(page_spec) for page, page_spec in spec.get("pages", {}).items()}
+
+
+def extract_page(site: str, page: str, html: str) -> Any:
+    """Module level so it can run on the parse executor, the plans are compiled in each worker."""
+    return site_plans(site)[page].extract(html)
+
+
+def compile_all_specs():
+    for name, spec in site_specs().items():
+        if not spec.get("abstract"):
+            site_plans(name)
+    logging.info(f"Compiled {len(site_specs())} scraper specs")
+
+
+async def skipped():
+    return None
+
+
+class SpecScraper(BaseScraper):
+    """Manga scraper driven by a site spec in ``specs/<site>.json``: urls, page parts, selectors and transforms."""
+
+    site: str = ""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.spec = site_specs()[self.site]
+        self.follow_redirects = self.spec.get("follow_redirects", False)
+
+    @classmethod
+    def unavailable_reason(cls) -> Optional[str]:
+        # Specs written on assumption (no fixtures prove them yet) say so, rather than serving empty pages
+        return site_specs()[cls.site].get("unavailable")
+
+    def page_url(self, kind: str, **params) -> str:
+        page_spec = self.spec["pages"][kind]
+        for name, value in page_spec.get("defaults", {}).items():
+            if not params.get(name):
+                params[name] = value
+        for name, aliases in page_spec.get("aliases", {}).items():
+            params[name] = aliases.get(str(params.get(name)), params.get(name))
+        return page_spec["url"].format(base_url=self.base_url, **params)
+
+    async def fetch_page(self, kind: str, **params) -> Any:
+        html = await self.fetch_html(self.page_url(kind, **params), route=kind)
+        return await self.parse(extract_page, self.site, kind, html)
+
+    async def scrape(self, page: Optional[int] = None, genre: Optional[str] = None, type: Optional[str] = None):
+        return self.index_titles(await self.fetch_page("list", page=page, genre=genre, type=type))
+
+    async def get_manga_details(self, manga_id: str):
+        return self.index_titles(await self.fetch_page("details", manga_id=manga_id), manga_id)
+
+    async def get_chapter_details(self, manga_id: str, chapter_id: str, include_manga: bool = True):
+        # fetch the chapter page and the manga data at the same time
+        chapter, manga = await asyncio.gather(
+            self.fetch_page("chapter", manga_id=manga_id, chapter_id=chapter_id),
+            self.get_manga_details_cached(manga_id) if include_manga else skipped())
+        return {**chapter, "manga": manga}
+
+    async def search_manga(self, word: str, page: int = 1):
+        return {
+            "page": page,
+            "mangas": self.index_titles(await self.fetch_page("search", word=word, page=page))
+        }
+
+
+def spec_scraper_class(site: str) -> Type[SpecScraper]:
+    """Scraper class for a site that only has a spec file."""
+    name = "".join(part.capitalize() for part in site.replace("-", "_").split("_")) + "Scraper"
+    return type(name, (SpecScraper,), {"site": site})
@@ -0,0 +1,72 @@
+import os
+import sys
+import asyncio
+
+# Run from the repo root: python test/episode-pages.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.scrapers import anime_scraper
+from src.scrapers.anime_scraper import AnitakuScraper, episode_number
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Saved episode list -> its details' total_episode. The gap one has an episode 0, a 7.5 special and no 5.
+CASES = [("anitaku-episode-list.html", 220), ("anitaku-episode-list-gap.html", 12)]
+
+
+class FixtureScraper(AnitakuScraper):
+    """Answers the ajax episode ranges from a saved full list, filtered by number like the upstream does."""
+
+    def __init__(self, html: str):
+        super().__init__("https://anitaku.test")
+        self.episodes = anime_scraper.parse_episode_list(html)
+
+    async def _fetch_episode_chunk(self, details, start, end):
+        return [episode for episode in self.episodes
+                if (start == 0 or episode_number(episode) > start) and episode_number(episode) <= end]
+
+
+async def check(fixture: str, total: int, chunk_size: int, per_page: int) -> int:
+    with open(os.path.join(FIXTURES, fixture), encoding="utf-8") as f:
+        scraper = FixtureScraper(f.read())
+    scraper.episode_chunk_size = chunk_size
+    details = {"total_episode": str(total), "movie_id": "1", "alias": fixture, "title": fixture}
+    failures = 0
+
+    everything = await scraper.get_episode_list(details)
+    if everything != scraper.episodes:
+        print(f"{fixture:32} chunk {chunk_size:3} full list differs")
+        failures += 1
+
+    # The /anime/{id}/?page= pages: per_page episode numbers each, newest first, together the whole list once
+    paged, page = [], 1
+    while True:
+        end = max(0, total - (page - 1) * per_page)
+        if not end:
+            break
+        start = max(0, end - per_page)
+        episodes = await scraper.get_episode_list(details, start, end)
+        outside = [episode["number"] for episode in episodes
+                   if not ((start == 0 or episode_number(episode) > start) and episode_number(episode) <= end)]
+        if outside:
+            print(f"{fixture:32} chunk {chunk_size:3} page {page}: {outside} outside {start}..{end}")
+            failures += 1
+        paged += episodes
+        page += 1
+    status = "ok" if paged == scraper.episodes else "DIFF pages do not add up to the list"
+    failures += paged != scraper.episodes
+    print(f"{fixture:32} chunk {chunk_size:3} per page {per_page:3} {status}")
+    return failures
+
+
+async def main():
+    failures = 0
+    for fixture, total in CASES:
+        for chunk_size, per_page in ((100, 50), (5, 5), (3, 4)):
+            failures += await check(fixture, total, chunk_size, per_page)
+    print(f"{failures} failures")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+import statistics
+import tracemalloc
+
+# Run from the repo root: python test/parser-benchmark.py [rounds]
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core import parsing
+
+# Reuse the fixture -> extraction function table of the parity check
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+parity = __import__("parser-parity")
+
+
+def time_parse(setup, fn, html, rounds):
+    parity.parse_with(setup, fn, html)  # warm up
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn(html)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def peak_memory(setup, fn, html):
+    parsing.HTML_PARSER, parsing.PARTIAL_PARSE = setup
+    tracemalloc.start()
+    fn(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    setups = parity.setups()
+    names = [parity.setup_name(setup) for setup in setups]
+
+    print(f"{'':57} time per page (median of {rounds}) / peak memory")
+    print(f"{'fixture':28} {'function':28} " + " ".join(f"{name:>18}" for name in names) + "  speedup")
+    totals = {setup: 0.0 for setup in setups}
+    for fixture, fn in parity.CASES:
+        with open(os.path.join(parity.FIXTURES, fixture), encoding="utf-8") as f:
+            html = f.read()
+        timings = {setup: time_parse(setup, fn, html, rounds) for setup in setups}
+        memory = {setup: peak_memory(setup, fn, html) for setup in setups}
+        for setup, seconds in timings.items():
+            totals[setup] += seconds
+        # How much faster the fastest setup is than the full html.parser parse
+        speedup = timings[parity.REFERENCE] / min(timings.values())
+        print(f"{fixture:28} {parity.label(fn):28} "
+              + " ".join(f"{timings[setup] * 1000:7.2f}ms {memory[setup] / 1024:6.0f}KB" for setup in setups)
+              + f"  {speedup:.2f}x")
+    print(f"{'total':57} " + " ".join(f"{totals[setup] * 1000:7.2f}ms {'':8}" for setup in setups))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import os
+import sys
+import json
+
+# Run from the repo root: python test/parser-parity.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from functools import partial
+
+from src.core import parsing
+from src.scrapers import anime_scraper
+from src.scrapers.spec_scraper import extract_page
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Saved upstream page -> extraction functions that read it
+CASES = [
+    *[(f"{site}-{page}.html", partial(extract_page, site, page))
+      for site in ("manganelo", "mangaclash") for page in ("list", "details", "chapter", "search")],
+    ("anitaku-popular.html", anime_scraper.parse_anime_cards),
+    ("anitaku-details.html", anime_scraper.parse_anime_details),
+    ("anitaku-episode.html", anime_scraper.parse_episode_page),
+    ("anitaku-download.html", anime_scraper.parse_download_links),
+    ("anitaku-recent.html", anime_scraper.parse_recently_added),
+    ("anitaku-recent.html", anime_scraper.parse_genre_list),
+    ("anitaku-list.html", anime_scraper.parse_anime_list),
+    ("anitaku-popular.html", anime_scraper.parse_listing),
+    ("anitaku-recent.html", anime_scraper.parse_listing),
+    ("anitaku-top-airing.html", anime_scraper.parse_top_airing),
+    ("anitaku-episode.html", anime_scraper.parse_episode_links),
+    ("anitaku-episode-list.html", anime_scraper.parse_episode_list),
+    ("anitaku-episode-list-gap.html", anime_scraper.parse_episode_list),
+    ("anitaku-recent.html", anime_scraper.parse_genre_links),
+    ("anitaku-list.html", anime_scraper.parse_anime_list_links),
+]
+
+# html.parser on the full page is what the scrapers always did, every other setup must match it
+REFERENCE = ("html.parser", False)
+
+
+def setups():
+    backends = [name for name in parsing.HTML_PARSERS if name != "lxml" or parsing.lxml_available()]
+    return [(backend, partial) for backend in backends for partial in (False, True)]
+
+
+def setup_name(setup):
+    backend, partial = setup
+    return f"{backend}{'+parts' if partial else ''}"
+
+
+def parse_with(setup, fn, html):
+    parsing.HTML_PARSER, parsing.PARTIAL_PARSE = setup
+    return fn(html)
+
+
+def first_difference(expected, actual, path="$"):
+    if type(expected) is not type(actual):
+        return f"{path}: {expected!r} != {actual!r}"
+    if isinstance(expected, dict):
+        for key in expected.keys() | actual.keys():
+            if key not in expected or key not in actual:
+                return f"{path}.{key}: missing on one side"
+            diff = first_difference(expected[key], actual[key], f"{path}.{key}")
+            if diff:
+                return diff
+        return None
+    if isinstance(expected, list):
+        if len(expected) != len(actual):
+            return f"{path}: {len(expected)} items != {len(actual)} items"
+        for index, (a, b) in enumerate(zip(expected, actual)):
+            diff = first_difference(a, b, f"{path}[{index}]")
+            if diff:
+                return diff
+        return None
+    return None if expected == actual else f"{path}: {expected!r} != {actual!r}"
+
+
+def label(fn):
+    return " ".join(fn.args) if isinstance(fn, partial) else fn.__name__
+
+
+def main():
+    failures = 0
+    for fixture, fn in CASES:
+        with open(os.path.join(FIXTURES, fixture), encoding="utf-8") as f:
+            html = f.read()
+        expected = parse_with(REFERENCE, fn, html)
+        for setup in setups():
+            if setup == REFERENCE:
+                continue
+            diff = first_difference(expected, parse_with(setup, fn, html))
+            status = "ok" if diff is None else f"DIFF {diff}"
+            failures += diff is not None
+            print(f"{fixture:28} {label(fn):28} {setup_name(setup):18} {status}")
+        if os.getenv("PARITY_DUMP"):
+            print(json.dumps(expected, indent=2, ensure_ascii=False)[:2000])
+
+    print(f"{failures} mismatches")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+import os
+import sys
+import asyncio
+import tempfile
+
+# Run from the repo root: python test/recommend-retry.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core import recommend
+from src.core.recommend import Recommender
+
+
+def details(title: str, description: str) -> dict:
+    return {"title": title, "description": description, "genres": ["Action"], "author": "Someone"}
+
+
+async def main():
+    if recommend.lancedb is None:
+        print("lancedb is not installed, skipped")
+        return 0
+    failures = 0
+    with tempfile.TemporaryDirectory() as path:
+        recommender = Recommender(os.path.join(path, "recommend.lance"), enabled=True)
+        recommender.load()
+        recommender.add("manganelo", "manga", "a", details("A", "first version of a"))
+        recommender.add("manganelo", "manga", "b", details("B", "only version of b"))
+
+        # The first write fails after a newer version of "a" was queued while it ran
+        create_table = recommender._db.create_table
+
+        def failing(*args, **kwargs):
+            recommender.add("manganelo", "manga", "a", details("A", "second version of a"))
+            raise OSError("disk full")
+
+        recommender._db.create_table = failing
+        try:
+            await recommender.flush()
+            print("failed write did not raise")
+            failures += 1
+        except OSError:
+            pass
+        recommender._db.create_table = create_table
+
+        queued = {key[2]: item["hash"] for key, item in recommender._pending.items()}
+        if sorted(queued) != ["a", "b"]:
+            print(f"queued after the failed write: {sorted(queued)}, expected a and b")
+            failures += 1
+        newer = Recommender(os.path.join(path, "unused.lance"), enabled=True)
+        newer.add("manganelo", "manga", "a", details("A", "second version of a"))
+        if queued.get("a") != newer._pending[("manganelo", "manga", "a")]["hash"]:
+            print("the failed batch overwrote the newer version of a")
+            failures += 1
+
+        await recommender.flush()
+        rows = recommender._table.to_arrow().select(["id", "hash"]).to_pylist()
+        stored = {row["id"]: row["hash"] for row in rows}
+        if recommender._pending or stored != queued:
+            print(f"retry stored {stored}, expected {queued}")
+            failures += 1
+        if sorted(key[2] for key in recommender._vectors) != ["a", "b"]:
+            print(f"vectors after the retry: {sorted(recommender._vectors)}")
+            failures += 1
+    print(f"{failures} failures")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))